@@ -1,11 +1,25 @@
 # bot.py
+import asyncio
 import os
 import logging
 from dotenv import load_dotenv
-from handlers.callbacks import favorite_callback
+from handlers.callbacks import favorite_callback, favorites_page_callback, open_recipe_callback
 from handlers.commands import COMMAND_HANDLERS
 from handlers.conversations import onboard_conv, recipe_conv
-from database.db import init_db
+from database.db import init_db, close_audit_log
+from database import async_db
+from database.persistence import SQLitePersistence
+from config.default import (
+    CONCURRENT_UPDATES, CHAT_BACKLOG_LIMIT, TELEGRAM_API_URL, BOT_MODE,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS, PERSISTENCE_ENABLED, PERSISTENCE_INTERVAL,
+    WORKERS, WORKER_BASE_PORT, METRICS_ENABLED, METRICS_LISTEN, METRICS_PORT,
+)
+from utils.log import configure_logging
+from supervisor import Supervisor
+from services import metrics, tracing, openai_service, pregeneration
+from utils.stages import StagedRequest, instrument_handlers
+from utils.update_processor import PerChatUpdateProcessor
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -14,38 +28,121 @@ from telegram.ext import (
     filters                 # if you use filters directly in bot.py
 )
 
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+async def on_startup(application):
+    # openai is imported and its client built once we are ready for updates
+    openai_service.warm_up()
+    # Workers serve /metrics on their own port, and only worker 0
+    # pre-generates (see supervisor.py)
+    if application.updater is not None:
+        if METRICS_ENABLED:
+            metrics.serve(METRICS_PORT, METRICS_LISTEN)
+        pregeneration.schedule(application)
+
+async def on_shutdown(application):
+    # Write buffered audit-log rows, drain queued DB work and
+    # release pooled SQLite connections
+    close_audit_log()
+    tracing.close()
+    async_db.shutdown()
+
+def build_application(token: str, updater: bool = True):
+    """Create the Application with every handler registered.
+
+    Workers behind the supervisor get their updates forwarded and run
+    without an Updater.
+    """
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        # Chats run concurrently, each chat's updates in order
+        .concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES, CHAT_BACKLOG_LIMIT))
+        # Root span per sampled update (see services/tracing.py)
+        .application_class(tracing.TracingApplication)
+        # Same pool size as the default request, plus per-call timing
+        .request(StagedRequest(connection_pool_size=256))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if not updater:
+        builder = builder.updater(None)
+    if PERSISTENCE_ENABLED:
+        # Half-finished /recipe and /onboard flows survive restarts
+        builder = builder.persistence(SQLitePersistence(update_interval=PERSISTENCE_INTERVAL))
+    application = builder.build()
+    
+    # Add command handlers
+    for handler in COMMAND_HANDLERS:
+        application.add_handler(handler)
+    
+    # Add conversation handlers
+    application.add_handler(onboard_conv)
+    application.add_handler(recipe_conv)
+    
+    application.add_handler(CallbackQueryHandler(favorite_callback, pattern=r"^fav\|"))
+    application.add_handler(CallbackQueryHandler(favorites_page_callback, pattern=r"^favp\|"))
+    application.add_handler(CallbackQueryHandler(open_recipe_callback, pattern=r"^open\|"))
+
+    # Time each handler for the benchmark, metrics and tracing (see utils/stages.py)
+    for handlers in application.handlers.values():
+        instrument_handlers(handlers)
+    if METRICS_ENABLED:
+        metrics.enable()
+    tracing.enable()
+    return application
+
+def run_webhook(application):
+    """Serve updates over HTTP (tornado, via python-telegram-bot[webhooks])."""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("Missing WEBHOOK_SECRET in .env (required for BOT_MODE=webhook)")
+    logger.info("Starting bot (webhook on %s:%d/%s)...", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+    # Requests without the matching secret-token header are rejected with 403
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=WEBHOOK_URL or None,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+    )
+
 def main():
+    # Enable logging (records are written by a background thread)
+    configure_logging()
+
     # 1) Load env & init DB
     load_dotenv()
     TOKEN = os.getenv("TELEGRAM_TOKEN")
     if not TOKEN:
         raise RuntimeError("Missing TELEGRAM_TOKEN in .env")
+    # Checked here rather than when the client is first built, so a missing
+    # key still stops the bot at startup
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Missing OpenAI API key; please set OPENAI_API_KEY in your .env")
     
     # 2) Initialize database
     init_db()
     
-    # 3) Create application and add handlers
-    application = ApplicationBuilder().token(TOKEN).build()
-    
-    # Add command handlers
-    for handler in COMMAND_HANDLERS:
-        application.add_handler(handler)
+    if BOT_MODE not in ("polling", "webhook"):
+        raise RuntimeError(f"Unknown BOT_MODE {BOT_MODE!r}; use 'polling' or 'webhook'")
+
+    # Several workers: this process only routes updates (see supervisor.py)
+    if WORKERS > 1:
+        asyncio.run(Supervisor(build_application, TOKEN, WORKERS, WORKER_BASE_PORT).run())
+        return
     
-    # Add conversation handlers
-    application.add_handler(onboard_conv)
-    application.add_handler(recipe_conv)
+    # 3) Create application and add handlers
+    application = build_application(TOKEN)
     
     # Start the bot
-    logger.info("Starting bot...")
-    application.add_handler(CallbackQueryHandler(favorite_callback, pattern=r"^fav\|"))
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        run_webhook(application)
+    else:
+        logger.info("Starting bot...")
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
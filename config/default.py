@@ -0,0 +1,129 @@
+# config/default.py
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ─── TELEGRAM ────────────────────────────────────────────────────────────────
+# How many updates the Application may process at the same time. Handlers
+# await slow I/O (OpenAI, SQLite), so other chats keep moving meanwhile;
+# updates from one chat still run one after another (utils/update_processor.py).
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "256"))
+# Updates a single chat may have waiting behind its running one; more are dropped
+CHAT_BACKLOG_LIMIT = int(os.getenv("CHAT_BACKLOG_LIMIT", "20"))
+# Bot API server; point at a local fake (tools/fake_telegram.py) to run offline
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+# "polling" (default) or "webhook". Webhook mode serves updates over HTTP so the
+# bot can sit behind a load balancer; Telegram must reach WEBHOOK_URL.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")              # public URL registered with Telegram
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")        # checked against X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # parallel deliveries, max 100
+
+# ─── WORKERS ─────────────────────────────────────────────────────────────────
+# WORKERS > 1 runs a supervisor that receives updates (polling or webhook, per
+# BOT_MODE) and forwards each user's updates to one of N worker processes on
+# 127.0.0.1:WORKER_BASE_PORT+i. Global budgets below are split across workers.
+WORKERS = max(1, int(os.getenv("WORKERS", "1")))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8600"))
+WORKER_RESTART_MAX_DELAY = float(os.getenv("WORKER_RESTART_MAX_DELAY", "30"))  # seconds
+
+# ─── OPENAI ──────────────────────────────────────────────────────────────────
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None   # e.g. tools/fake_openai.py for offline runs
+# Upper bound on chat completions in flight across all users.
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+
+# ─── RECIPE CACHE ────────────────────────────────────────────────────────────
+# Identical requests (same inputs + preferences) are answered from SQLite.
+RECIPE_CACHE_TTL = int(os.getenv("RECIPE_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+RECIPE_CACHE_MAX_ENTRIES = int(os.getenv("RECIPE_CACHE_MAX_ENTRIES", "5000"))
+
+# ─── STREAMING ───────────────────────────────────────────────────────────────
+# Stream completions into a placeholder message instead of waiting for the
+# full recipe. Edits are coalesced to at most one per interval per chat.
+OPENAI_STREAMING = os.getenv("OPENAI_STREAMING", "1").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))  # seconds
+
+# ─── MEAL PLANS ──────────────────────────────────────────────────────────────
+# /mealplan generates one recipe per day concurrently, at most
+# MEALPLAN_CONCURRENCY at a time per plan (the global OpenAI cap still applies).
+MEALPLAN_MAX_DAYS = int(os.getenv("MEALPLAN_MAX_DAYS", "7"))
+MEALPLAN_CONCURRENCY = int(os.getenv("MEALPLAN_CONCURRENCY", "7"))
+MEALPLAN_SERVINGS = int(os.getenv("MEALPLAN_SERVINGS", "2"))
+MEALPLAN_TIME = int(os.getenv("MEALPLAN_TIME", "45"))          # minutes per meal
+
+# ─── PRE-GENERATION ──────────────────────────────────────────────────────────
+# A JobQueue job (needs python-telegram-bot[job-queue]) predicts each active
+# user's next /recipe from recipe_requests and generates it ahead of time,
+# only while no user generations are running or recent (in any worker) and
+# within a daily token budget.
+PREGEN_ENABLED = os.getenv("PREGEN_ENABLED", "0").lower() in ("1", "true", "yes")
+PREGEN_INTERVAL = float(os.getenv("PREGEN_INTERVAL", "900"))               # seconds between runs
+PREGEN_DAILY_TOKENS = int(os.getenv("PREGEN_DAILY_TOKENS", "50000"))       # spend cap per 24h
+PREGEN_USERS_PER_RUN = int(os.getenv("PREGEN_USERS_PER_RUN", "20"))
+PREGEN_ACTIVE_DAYS = float(os.getenv("PREGEN_ACTIVE_DAYS", "14"))          # "active" = requested within
+PREGEN_MIN_REQUESTS = int(os.getenv("PREGEN_MIN_REQUESTS", "3"))           # history needed to predict
+PREGEN_CANDIDATE_TTL = int(os.getenv("PREGEN_CANDIDATE_TTL", str(24 * 3600)))  # seconds
+PREGEN_IDLE_SECONDS = float(os.getenv("PREGEN_IDLE_SECONDS", "120"))        # quiet time needed, all workers
+
+# ─── DATABASE ────────────────────────────────────────────────────────────────
+DB_FILE = os.getenv("DB_FILE", "")                                # default: database/bot.db
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))       # ms to wait on a locked db
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))  # prepared statements per connection
+DB_READER_THREADS = int(os.getenv("DB_READER_THREADS", "4"))      # writes always use one thread
+# Recipe bodies are stored once per distinct text, compressed. "zstd" needs
+# the optional zstandard package; a trained dictionary is used when present.
+BODY_COMPRESSION = os.getenv("BODY_COMPRESSION", "zlib").lower()
+BODY_COMPRESSION_LEVEL = int(os.getenv("BODY_COMPRESSION_LEVEL", "9"))
+
+# ─── PERSISTENCE ─────────────────────────────────────────────────────────────
+# Conversation states and user_data survive restarts in the bot_state table.
+# Changes are collected and written at most once per interval.
+PERSISTENCE_ENABLED = os.getenv("PERSISTENCE_ENABLED", "1").lower() in ("1", "true", "yes")
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "1"))  # seconds
+
+# ─── IN-PROCESS CACHES ───────────────────────────────────────────────────────
+PREFS_CACHE_SIZE = int(os.getenv("PREFS_CACHE_SIZE", "10000"))  # users kept in memory
+
+# ─── AUDIT LOG ───────────────────────────────────────────────────────────────
+# recipe_requests rows are buffered and written in batches off the request path
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "1000")) / 1000  # seconds
+
+# ─── METRICS ─────────────────────────────────────────────────────────────────
+# Prometheus text format on http://METRICS_LISTEN:METRICS_PORT/metrics. With
+# WORKERS > 1 each worker serves /metrics next to /health on its own port.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# ─── TRACING ─────────────────────────────────────────────────────────────────
+# A sampled fraction of updates is appended to TRACE_FILE as JSON lines (root
+# span per update, child spans for DB, OpenAI and Bot API calls). With
+# TRACE_SLOW_MS > 0 every update slower than that is kept as well.
+# `kill -USR1 <pid>` runs the next update under cProfile (see services/tracing.py).
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))   # 0..1
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# ─── LOGGING ─────────────────────────────────────────────────────────────────
+# DEBUG enables per-call diagnostics (including extra queries); keep INFO in production
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+FAVORITES_PAGE_SIZE = int(os.getenv("FAVORITES_PAGE_SIZE", "8"))        # recipes per /favorites page
+FAVORITES_CACHE_SIZE = int(os.getenv("FAVORITES_CACHE_SIZE", "5000"))   # rendered pages kept in memory
+
+# ─── ADMISSION CONTROL ───────────────────────────────────────────────────────
+# Generations that miss the cache pass through services/admission.py first.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", str(OPENAI_MAX_CONCURRENCY)))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "200"))      # waiting beyond this are shed
+OPENAI_TPM_BUDGET = int(os.getenv("OPENAI_TPM_BUDGET", "40000"))          # tokens per minute, all users
+ESTIMATED_TOKENS_PER_RECIPE = int(os.getenv("ESTIMATED_TOKENS_PER_RECIPE", "1500"))
+USER_RECIPE_BURST = int(os.getenv("USER_RECIPE_BURST", "3"))              # back-to-back generations per user
+USER_RECIPES_PER_MINUTE = float(os.getenv("USER_RECIPES_PER_MINUTE", "1"))
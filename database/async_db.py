@@ -0,0 +1,95 @@
+# database/async_db.py
+"""Awaitable wrappers around database.db so handlers never block the event loop.
+
+Writes go through a single writer thread (SQLite allows one writer anyway);
+reads are spread over a small pool of reader threads.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config.default import DB_READER_THREADS
+from database import db
+from utils.stages import stage
+
+_writer  = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_readers = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix="db-reader")
+
+# Calls submitted and not yet finished, per pool (event loop only)
+_pending = {"read": 0, "write": 0}
+
+async def _run(executor: ThreadPoolExecutor, pool: str, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry contextvars into the worker thread like asyncio.to_thread does
+    ctx  = contextvars.copy_context()
+    _pending[pool] += 1
+    try:
+        # Timed from the caller's side, so time spent queued for a thread counts
+        with stage(f"db.{fn.__name__}"):
+            return await loop.run_in_executor(executor, functools.partial(ctx.run, fn, *args, **kwargs))
+    finally:
+        _pending[pool] -= 1
+
+async def run_read(fn, *args, **kwargs):
+    """Run a read-only database function on a reader thread."""
+    return await _run(_readers, "read", fn, *args, **kwargs)
+
+async def run_write(fn, *args, **kwargs):
+    """Run a database function that writes on the writer thread."""
+    return await _run(_writer, "write", fn, *args, **kwargs)
+
+def pending() -> dict:
+    """Database calls queued or running, per pool."""
+    return dict(_pending)
+
+def _reader(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_read(fn, *args, **kwargs)
+    return wrapper
+
+def _writer_fn(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_write(fn, *args, **kwargs)
+    return wrapper
+
+# ─── READS ───────────────────────────────────────────────────────────────────
+list_favorites       = _reader(db.list_favorites)
+get_recipe           = _reader(db.get_recipe)
+get_recipe_by_id     = _reader(db.get_recipe_by_id)
+search_recipes       = _reader(db.search_recipes)
+filter_recipes       = _reader(db.filter_recipes)
+
+async def get_user_preferences(user_id: int):
+    # Cached preferences are returned without a thread hop
+    prefs = db.cached_user_preferences(user_id)
+    if prefs is not None:
+        return prefs
+    return await run_read(db.load_user_preferences, user_id)
+
+async def list_favorites_page(user_id: int, direction: str = "next", cursor: int | None = None):
+    # Cached pages are returned without a thread hop
+    page = db.cached_favorites_page(user_id, direction, cursor)
+    if page is not None:
+        return page
+    return await run_read(db.list_favorites_page, user_id, direction, cursor)
+
+# ─── WRITES ──────────────────────────────────────────────────────────────────
+save_recipe          = _writer_fn(db.save_recipe)
+save_recipes         = _writer_fn(db.save_recipes)
+set_favorite         = _writer_fn(db.set_favorite)
+clear_favorites      = _writer_fn(db.clear_favorites)
+set_user_preferences = _writer_fn(db.set_user_preferences)
+put_cached_recipe    = _writer_fn(db.put_cached_recipe)
+# A cache hit also bumps last_used, so lookups go through the writer too
+get_cached_recipe    = _writer_fn(db.get_cached_recipe)
+# Claiming a candidate deletes it
+take_recipe_candidate = _writer_fn(db.take_recipe_candidate)
+
+def shutdown():
+    """Wait for queued database work, then close every pooled connection."""
+    _writer.shutdown(wait=True)
+    _readers.shutdown(wait=True)
+    db.close_connections()
@@ -0,0 +1,98 @@
+# database/audit_log.py
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class AuditLogWriter:
+    """Append-only buffered writer for analytics rows.
+
+    append() only enqueues, so callers never wait on SQLite. A background
+    thread writes the queued rows in one transaction whenever batch_size rows
+    have piled up or flush_interval seconds have passed since the first
+    unwritten row, whichever comes first.
+    """
+
+    def __init__(self, write_batch: Callable[[Sequence[tuple]], None],
+                 batch_size: int, flush_interval: float, name: str = "audit-log"):
+        self._write_batch    = write_batch
+        self._batch_size     = batch_size
+        self._flush_interval = flush_interval
+        self._name           = name
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock     = threading.Lock()
+
+    def append(self, row: tuple):
+        self._ensure_started()
+        self._queue.put(row)
+
+    @property
+    def pending(self) -> int:
+        """Rows (and flush markers) queued but not yet written."""
+        return self._queue.qsize()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until every row appended so far has been written."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float | None = 10):
+        """Write what is still queued and stop the background thread."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        batch: list[tuple] = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self._flush_interval
+                if len(batch) < self._batch_size:
+                    continue
+
+            # Batch full, deadline passed, flush requested or stopping
+            if batch:
+                self._write(batch)
+                batch, deadline = [], None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def _write(self, batch: list[tuple]):
+        try:
+            self._write_batch(batch)
+        except Exception:
+            # Analytics must never take the bot down; the rows are dropped
+            logger.exception("Failed to write %d %s rows", len(batch), self._name)
@@ -0,0 +1,213 @@
+# database/bodies.py
+"""Content-addressed, compressed storage for recipe bodies.
+
+recipes.body_hash (and the same column in recipe_cache and
+recipe_candidates) points at a row in recipe_bodies keyed by the SHA-256 of
+the text, so a body shared by several rows (e.g. a cached generation saved
+by many users) is stored once. Rows record their codec and optional
+dictionary, so changing BODY_COMPRESSION or training a new dictionary never
+breaks older rows.
+
+    python -m database.bodies stats   # sizes and compression ratio
+    python -m database.bodies train   # train a dictionary, recompress, VACUUM
+"""
+import collections
+import hashlib
+import logging
+import sqlite3
+import sys
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is always available
+    zstandard = None
+
+from config.default import BODY_COMPRESSION, BODY_COMPRESSION_LEVEL
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+DICT_SIZE = 32 * 1024   # zlib can't use more than a 32 KiB window anyway
+MIN_TRAINING_SAMPLES = 50
+
+# Dictionaries never change once written, so they are cached forever
+_dicts: dict[int, bytes] = {}
+_current: dict[int, int | None] = {}   # codec -> newest dict id (None: no dict)
+_lock = threading.Lock()
+
+def _codec() -> int:
+    if BODY_COMPRESSION == "zstd":
+        if zstandard is not None:
+            return CODEC_ZSTD
+        logger.warning("BODY_COMPRESSION=zstd but zstandard is not installed; using zlib")
+    return CODEC_ZLIB
+
+def _dictionary(conn: sqlite3.Connection, dict_id: int) -> bytes:
+    with _lock:
+        if dict_id not in _dicts:
+            row = conn.execute("SELECT data FROM compression_dicts WHERE id = ?", (dict_id,)).fetchone()
+            _dicts[dict_id] = row[0]
+        return _dicts[dict_id]
+
+def _current_dictionary(conn: sqlite3.Connection, codec: int) -> int | None:
+    with _lock:
+        if codec not in _current:
+            row = conn.execute(
+                "SELECT id FROM compression_dicts WHERE codec = ? ORDER BY id DESC LIMIT 1",
+                (codec,)
+            ).fetchone()
+            _current[codec] = row[0] if row else None
+        return _current[codec]
+
+def compress(text: str, codec: int, zdict: bytes | None = None) -> bytes:
+    raw = text.encode("utf-8")
+    if codec == CODEC_ZSTD:
+        dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        return zstandard.ZstdCompressor(level=BODY_COMPRESSION_LEVEL, dict_data=dict_data).compress(raw)
+    c = zlib.compressobj(BODY_COMPRESSION_LEVEL, zdict=zdict) if zdict else zlib.compressobj(BODY_COMPRESSION_LEVEL)
+    return c.compress(raw) + c.flush()
+
+def decompress(data: bytes, codec: int, zdict: bytes | None = None) -> str:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("recipe body is zstd-compressed; install zstandard to read it")
+        dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        raw = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+    else:
+        d = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        raw = d.decompress(data) + d.flush()
+    return raw.decode("utf-8")
+
+def body_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+def store_body(conn: sqlite3.Connection, text: str) -> bytes:
+    """Store text if it isn't already and return its hash. Call inside a transaction."""
+    h = body_hash(text)
+    if conn.execute("SELECT 1 FROM recipe_bodies WHERE hash = ?", (h,)).fetchone():
+        return h
+    codec = _codec()
+    dict_id = _current_dictionary(conn, codec)
+    zdict = _dictionary(conn, dict_id) if dict_id is not None else None
+    conn.execute(
+        "INSERT INTO recipe_bodies (hash, codec, dict_id, size, data) VALUES (?, ?, ?, ?, ?)",
+        (h, codec, dict_id, len(text.encode("utf-8")), compress(text, codec, zdict))
+    )
+    return h
+
+def decode_body(conn: sqlite3.Connection, codec: int, dict_id: int | None, data: bytes) -> str:
+    """Text of a recipe_bodies row given its (codec, dict_id, data) columns."""
+    zdict = _dictionary(conn, dict_id) if dict_id is not None else None
+    return decompress(data, codec, zdict)
+
+def load_body(conn: sqlite3.Connection, h: bytes) -> str | None:
+    row = conn.execute("SELECT codec, dict_id, data FROM recipe_bodies WHERE hash = ?", (h,)).fetchone()
+    return decode_body(conn, *row) if row else None
+
+def release_body(conn: sqlite3.Connection, h: bytes):
+    """Delete a body once no recipe, cache entry or candidate references it. Call inside a transaction."""
+    conn.execute(
+        """
+        DELETE FROM recipe_bodies WHERE hash = ?
+           AND NOT EXISTS (SELECT 1 FROM recipes WHERE body_hash = ?)
+           AND NOT EXISTS (SELECT 1 FROM recipe_cache WHERE body_hash = ?)
+           AND NOT EXISTS (SELECT 1 FROM recipe_candidates WHERE body_hash = ?)
+        """,
+        (h, h, h, h)
+    )
+
+# ─── DICTIONARY TRAINING ─────────────────────────────────────────────────────
+def _train_zlib(samples: list[str]) -> bytes:
+    # zlib's "dictionary" is just text the compressor can back-reference.
+    # Use lines that recur across recipes, most common last (nearest).
+    counts = collections.Counter(
+        line for s in samples for line in set(s.splitlines()) if len(line.strip()) > 3
+    )
+    common = [line for line, n in counts.most_common() if n > 1]
+    out, size = [], 0
+    for line in common:
+        encoded = (line + "\n").encode("utf-8")
+        if size + len(encoded) > DICT_SIZE:
+            break
+        out.append(encoded)
+        size += len(encoded)
+    return b"".join(reversed(out))
+
+def train_dictionary(conn: sqlite3.Connection) -> int | None:
+    """Train a dictionary on the stored bodies and return its id.
+
+    Returns None when there are too few bodies to learn from. Existing rows
+    keep their dictionary; use recompress() to move them to the new one.
+    """
+    rows = conn.execute(
+        "SELECT codec, dict_id, data FROM recipe_bodies ORDER BY RANDOM() LIMIT 2000"
+    ).fetchall()
+    if len(rows) < MIN_TRAINING_SAMPLES:
+        return None
+    samples = [decode_body(conn, *row) for row in rows]
+
+    codec = _codec()
+    if codec == CODEC_ZSTD:
+        data = zstandard.train_dictionary(DICT_SIZE * 4, [s.encode("utf-8") for s in samples]).as_bytes()
+    else:
+        data = _train_zlib(samples)
+    if not data:
+        return None
+
+    dict_id = conn.execute(
+        "INSERT INTO compression_dicts (codec, data, created_at) VALUES (?, ?, strftime('%s', 'now'))",
+        (codec, data)
+    ).lastrowid
+    with _lock:
+        _dicts[dict_id] = data
+        _current[codec] = dict_id
+    logger.info("Trained %d-byte compression dictionary %d from %d bodies", len(data), dict_id, len(samples))
+    return dict_id
+
+def recompress(conn: sqlite3.Connection) -> int:
+    """Rewrite every body with the current codec and dictionary; returns rows changed."""
+    codec = _codec()
+    dict_id = _current_dictionary(conn, codec)
+    zdict = _dictionary(conn, dict_id) if dict_id is not None else None
+    changed = 0
+    rows = conn.execute("SELECT hash, codec, dict_id, data FROM recipe_bodies").fetchall()
+    for h, old_codec, old_dict, data in rows:
+        if (old_codec, old_dict) == (codec, dict_id):
+            continue
+        text = decode_body(conn, old_codec, old_dict, data)
+        conn.execute(
+            "UPDATE recipe_bodies SET codec = ?, dict_id = ?, data = ? WHERE hash = ?",
+            (codec, dict_id, compress(text, codec, zdict), h)
+        )
+        changed += 1
+    return changed
+
+def stats(conn: sqlite3.Connection) -> dict:
+    bodies, raw, stored = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM recipe_bodies"
+    ).fetchone()
+    recipes = conn.execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+    return {
+        "recipes":      recipes,
+        "bodies":       bodies,
+        "raw_bytes":    raw,
+        "stored_bytes": stored,
+        "ratio":        raw / stored if stored else 0.0,
+    }
+
+if __name__ == "__main__":
+    from database import db
+
+    db.init_db()
+    conn = db.get_connection()
+    if sys.argv[1:] == ["train"]:
+        with db.transaction() as conn:
+            if train_dictionary(conn) is None:
+                sys.exit(f"Need at least {MIN_TRAINING_SAMPLES} stored bodies to train a dictionary")
+            print(f"Recompressed {recompress(conn)} bodies")
+        conn.execute("VACUUM")
+    print(stats(conn))
@@ -1,156 +1,260 @@
 # database/db.py
+import difflib
+import logging
+import re
 import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Sequence
+from config.default import (
+    DB_FILE, DB_BUSY_TIMEOUT, DB_STATEMENT_CACHE, PREFS_CACHE_SIZE,
+    AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL,
+    FAVORITES_PAGE_SIZE, FAVORITES_CACHE_SIZE,
+)
+from database.audit_log import AuditLogWriter
+from database.bodies import store_body, load_body, release_body, decode_body
+from database.migrations import migrate
 from models.user_preferences import UserPreferences
 from models.recipe_request import RecipeRequest
+from utils.cache import LRUCache
+from utils.recipe_parser import clean_recipe_name, parse_recipe, recipe_title
 
-DB_PATH = Path(__file__).parent / "bot.db"
+logger = logging.getLogger(__name__)
 
-def get_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+DB_PATH = Path(DB_FILE) if DB_FILE else Path(__file__).parent / "bot.db"
 
-def init_db():
-    print("[DEBUG] Initializing database...")
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Check if users table exists
-    c.execute("""
-        SELECT name FROM sqlite_master 
-        WHERE type='table' AND name='users'
-    """)
-    
-    if not c.fetchone():
-        # Create users table if it doesn't exist
-        c.execute("""
-          CREATE TABLE users (
-            user_id INTEGER PRIMARY KEY,
-            dietary TEXT,
-            skill TEXT,
-            budget TEXT
-          )
-        """)
-    
-    # Check if recipes table exists
-    c.execute("""
-        SELECT name FROM sqlite_master 
-        WHERE type='table' AND name='recipes'
-    """)
+# One long-lived connection per thread; tracked so they can be closed on shutdown
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+
+# Preferences only change through set_user_preferences, which writes through.
+# Reads run on other threads: one that started before a write commits must
+# not cache what it read, so writes bump the user's version and a read only
+# fills the cache if the version is unchanged.
+_prefs_cache = LRUCache(PREFS_CACHE_SIZE)
+_prefs_versions: dict[int, int] = {}
+_prefs_lock = threading.Lock()
+
+def _cache_written_preferences(user_id: int, prefs: UserPreferences | None):
+    """After a committed write (or a failed one, with None): replace the cached entry."""
+    with _prefs_lock:
+        _prefs_versions[user_id] = _prefs_versions.get(user_id, 0) + 1
+        if prefs is None:
+            _prefs_cache.pop(user_id)
+        else:
+            _prefs_cache.put(user_id, prefs)
+
+# Favorites pages keyed by (user_id, version, direction, cursor). Writes bump
+# the user's version, so stale pages simply stop being looked up.
+_favorites_pages = LRUCache(FAVORITES_CACHE_SIZE)
+_favorites_versions: dict[int, int] = {}
+_MAX_ROWID = 2**63 - 1
+
+def _invalidate_favorites(user_id: int):
+    _favorites_versions[user_id] = _favorites_versions.get(user_id, 0) + 1
+
+# Indexed search terms by first letter, for typo correction in search_recipes
+VOCAB_CACHE_TTL = 600  # seconds
+_vocab_cache = LRUCache(64)
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT / 1000,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE,
+    )
+    # WAL lets readers proceed while a writer commits; NORMAL is durable
+    # enough in WAL mode and skips an fsync per transaction.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT)}")
+    return conn
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's connection, opening it on first use.
     
-    if not c.fetchone():
-        # Create recipes table if it doesn't exist
-        c.execute("""
-          CREATE TABLE recipes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            body TEXT NOT NULL,
-            is_fav BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(user_id, name) ON CONFLICT REPLACE,
-            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-          )
-        """)
-    else:
-        # Check if is_fav column exists, add it if not
-        c.execute("PRAGMA table_info(recipes)")
-        columns = [col[1] for col in c.fetchall()]
-        if 'is_fav' not in columns:
-            c.execute("ALTER TABLE recipes ADD COLUMN is_fav BOOLEAN DEFAULT 0")
+    Connections are reused for the life of the thread, so callers must not
+    close them; use close_connections() on shutdown instead.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DB_PATH:
+        conn = _open_connection()
+        _local.conn, _local.path = conn, DB_PATH
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+@contextmanager
+def transaction():
+    """Yield this thread's connection and commit on success, roll back on error."""
+    conn = get_connection()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def close_connections():
+    """Close every pooled connection (call once on shutdown)."""
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+    _local.__dict__.clear()
+
+def init_db():
+    """Bring the schema up to date; a no-op when user_version is current."""
+    logger.debug("Initializing database...")
+    version = migrate(get_connection())
+    logger.info("Database initialized successfully (schema v%d)", version)
+
+def _write_recipe(conn: sqlite3.Connection, user_id: int, name: str | None, body: str) -> int:
+    """Insert or replace one recipe inside the caller's transaction; returns its id.
+
+    Without a usable name the recipe's own title is used, and without one of
+    those it is stored as a new "Recipe #<id>" rather than under an empty
+    name that every other untitled recipe would overwrite.
+    """
+    # Clean the name once here so readers never have to
+    cleaned_name = clean_recipe_name(name or "") or recipe_title(body)
+    untitled = not cleaned_name
+    if untitled:
+        # Unique until renamed after the insert below
+        cleaned_name = f"\0untitled-{uuid.uuid4().hex}"
+    details = parse_recipe(body)
+
+    logger.debug("Saving recipe. Original name: %r, Cleaned name: %r", name, cleaned_name)
+
+    cursor = conn.cursor()
     
-    # Check if recipe_requests table exists and create if it doesn't
-    c.execute("""
-        SELECT name FROM sqlite_master 
-        WHERE type='table' AND name='recipe_requests'
-    """)
+    # First ensure the user exists in the users table
+    cursor.execute(
+        "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
+        (user_id,)
+    )
     
-    if not c.fetchone():
-        # Create recipe_requests table
-        c.execute("""
-          CREATE TABLE recipe_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            cuisine TEXT,
-            meal TEXT,
-            servings INTEGER,
-            time_limit INTEGER,
-            ingredients TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-          )
-        """)
+    # Saving the same title again replaces the old body
+    old = cursor.execute(
+        "SELECT id, body_hash FROM recipes WHERE user_id = ? AND name = ?",
+        (user_id, cleaned_name)
+    ).fetchone()
+    new_hash = store_body(conn, body)
+
+    # Then insert or update the recipe
+    cursor.execute(
+        """
+        INSERT INTO recipes (user_id, name, body_hash, is_fav, created_at,
+                             total_minutes, kcal, protein_g, carbs_g, fat_g, budget_thb)
+        VALUES (?, ?, ?, 0, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, name) DO UPDATE SET 
+            body_hash = excluded.body_hash,
+            created_at = CURRENT_TIMESTAMP,
+            total_minutes = excluded.total_minutes,
+            kcal = excluded.kcal,
+            protein_g = excluded.protein_g,
+            carbs_g = excluded.carbs_g,
+            fat_g = excluded.fat_g,
+            budget_thb = excluded.budget_thb
+        RETURNING id
+        """,
+        (user_id, cleaned_name, new_hash, details.total_minutes, details.kcal,
+         details.protein_g, details.carbs_g, details.fat_g, details.budget_thb)
+    )
     
-    conn.commit()
-    print("[DEBUG] Database initialized successfully")
-    conn.close()
+    result = cursor.fetchone()
+    if not result:
+        # If no row was returned (shouldn't happen with RETURNING), try to get the ID
+        cursor.execute(
+            "SELECT id FROM recipes WHERE user_id = ? AND name = ?",
+            (user_id, cleaned_name)
+        )
+        result = cursor.fetchone()
+        if not result:
+            raise Exception("Failed to retrieve recipe ID after insert/update")
+    recipe_id = result[0]
+    if untitled:
+        cleaned_name = f"Recipe #{recipe_id}"
+        cursor.execute("UPDATE OR ABORT recipes SET name = ? WHERE id = ?", (cleaned_name, recipe_id))
+
+    # recipes_fts is contentless: removing a row needs its exact old text
+    if old is None or old[1] != new_hash:
+        if old is not None:
+            cursor.execute(
+                "INSERT INTO recipes_fts (recipes_fts, rowid, name, body, user_id) VALUES ('delete', ?, ?, ?, ?)",
+                (recipe_id, cleaned_name, load_body(conn, old[1]) or "", user_id)
+            )
+            release_body(conn, old[1])
+        cursor.execute(
+            "INSERT INTO recipes_fts (rowid, name, body, user_id) VALUES (?, ?, ?, ?)",
+            (recipe_id, cleaned_name, body, user_id)
+        )
+
+    cursor.execute("DELETE FROM recipe_ingredients WHERE recipe_id = ?", (recipe_id,))
+    cursor.executemany(
+        "INSERT INTO recipe_ingredients (recipe_id, position, item) VALUES (?, ?, ?)",
+        [(recipe_id, i, item) for i, item in enumerate(details.ingredients)]
+    )
+    return recipe_id
 
-def save_recipe(user_id: int, name: str, body: str) -> int:
+def save_recipe(user_id: int, name: str | None, body: str) -> int:
     """Save a recipe to the database.
     
+    The body is parsed once here (see utils.recipe_parser.parse_recipe) into
+    typed columns and recipe_ingredients rows, so readers never re-parse it.
+    The text itself goes to recipe_bodies (see database.bodies), and the
+    contentless full-text index is updated alongside.
+    
     Args:
         user_id: The ID of the user who owns the recipe
-        name: The name of the recipe (will be cleaned up)
+        name: The name of the recipe (will be cleaned up); None to use
+            the title in the body
         body: The full recipe text
         
     Returns:
         int: The ID of the saved recipe
     """
-    # Clean up the recipe name by removing any leading numbers or dots
-    import re
-    cleaned_name = re.sub(r'^\d+[\.\s]*', '', name)  # Remove leading numbers and dots
-    cleaned_name = re.sub(r'^Title[:\s]*', '', cleaned_name, flags=re.IGNORECASE)  # Remove 'Title:'
-    cleaned_name = cleaned_name.strip()  # Remove any extra whitespace
-    
-    print(f"[DEBUG] Saving recipe. Original name: '{name}', Cleaned name: '{cleaned_name}'")
-    
     conn = get_connection()
     try:
-        cursor = conn.cursor()
-        
-        # First ensure the user exists in the users table
-        cursor.execute(
-            "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
-            (user_id,)
-        )
-        
-        # Then insert or update the recipe
-        cursor.execute(
-            """
-            INSERT INTO recipes (user_id, name, body, is_fav, created_at)
-            VALUES (?, ?, ?, 0, CURRENT_TIMESTAMP)
-            ON CONFLICT(user_id, name) DO UPDATE SET 
-                body = excluded.body,
-                created_at = CURRENT_TIMESTAMP
-            RETURNING id
-            """,
-            (user_id, cleaned_name, body)
-        )
-        
-        result = cursor.fetchone()
-        if result:
-            recipe_id = result[0]
-            print(f"[DEBUG] Recipe {recipe_id} saved/updated successfully for user {user_id}")
-            conn.commit()
-            return recipe_id
-        else:
-            # If no row was returned (shouldn't happen with RETURNING), try to get the ID
-            cursor.execute(
-                "SELECT id FROM recipes WHERE user_id = ? AND name = ?",
-                (user_id, cleaned_name)
-            )
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            raise Exception("Failed to retrieve recipe ID after insert/update")
+        recipe_id = _write_recipe(conn, user_id, name, body)
+        conn.commit()
+        logger.debug("Recipe %s saved/updated successfully for user %s", recipe_id, user_id)
+        _invalidate_favorites(user_id)
+        return recipe_id
             
-    except Exception as e:
-        print(f"[ERROR] Error saving recipe: {e}")
-        import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Error saving recipe for user %s", user_id)
+        conn.rollback()
+        raise
+
+def save_recipes(user_id: int, recipes: Sequence[tuple[str, str]]) -> list[int]:
+    """Save several (name, body) recipes in a single transaction.
+
+    Same storage as save_recipe; either all of them are saved or none.
+
+    Returns:
+        The recipe IDs, in the order given
+    """
+    conn = get_connection()
+    try:
+        ids = [_write_recipe(conn, user_id, name, body) for name, body in recipes]
+        conn.commit()
+        logger.debug("Saved %d recipes for user %s", len(ids), user_id)
+        _invalidate_favorites(user_id)
+        return ids
+
+    except Exception:
+        logger.exception("Error saving %d recipes for user %s", len(recipes), user_id)
         conn.rollback()
         raise
-    finally:
-        conn.close()
 
 def set_favorite(user_id: int, recipe_id: int, fav: bool = True) -> bool:
     """
@@ -164,7 +268,7 @@ def set_favorite(user_id: int, recipe_id: int, fav: bool = True) -> bool:
     Returns:
         bool: True if the update was successful, False otherwise
     """
-    print(f"[DEBUG] Setting favorite: user_id={user_id}, recipe_id={recipe_id}, fav={fav}")
+    logger.debug("Setting favorite: user_id=%s, recipe_id=%s, fav=%s", user_id, recipe_id, fav)
     conn = get_connection()
     try:
         # First verify the recipe exists and belongs to the user
@@ -176,7 +280,7 @@ def set_favorite(user_id: int, recipe_id: int, fav: bool = True) -> bool:
         recipe = cursor.fetchone()
         
         if not recipe:
-            print(f"[ERROR] Recipe {recipe_id} not found for user {user_id}")
+            logger.warning("Recipe %s not found for user %s", recipe_id, user_id)
             return False
             
         # Update the favorite status
@@ -186,22 +290,17 @@ def set_favorite(user_id: int, recipe_id: int, fav: bool = True) -> bool:
         )
         
         rows_affected = cursor.rowcount
-        print(f"[DEBUG] Updated favorite status for recipe {recipe[0]} ("
-              f"{recipe[1]}): {fav}, Rows affected: {rows_affected}")
+        logger.debug("Updated favorite status for recipe %s (%s): %s, Rows affected: %d",
+                     recipe[0], recipe[1], fav, rows_affected)
               
         conn.commit()
+        _invalidate_favorites(user_id)
         return rows_affected > 0
         
-    except Exception as e:
-        print(f"[ERROR] Error in set_favorite: {e}")
-        import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
-        if conn:
-            conn.rollback()
+    except Exception:
+        logger.exception("Error in set_favorite")
+        conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def clear_favorites(user_id: int) -> bool:
     """
@@ -213,22 +312,20 @@ def clear_favorites(user_id: int) -> bool:
     Returns:
         bool: True if successful, False otherwise
     """
-    print(f"[DEBUG] Clearing all favorites for user_id={user_id}")
-    conn = get_connection()
+    logger.debug("Clearing all favorites for user_id=%s", user_id)
     try:
-        conn.execute(
-            "UPDATE recipes SET is_fav = 0 WHERE user_id = ?",
-            (user_id,)
-        )
-        changes = conn.total_changes
-        conn.commit()
-        print(f"[DEBUG] Cleared {changes} favorites for user {user_id}")
+        with transaction() as conn:
+            # rowcount, not total_changes: the connection outlives this call
+            changes = conn.execute(
+                "UPDATE recipes SET is_fav = 0 WHERE user_id = ?",
+                (user_id,)
+            ).rowcount
+        _invalidate_favorites(user_id)
+        logger.debug("Cleared %d favorites for user %s", changes, user_id)
         return changes > 0
-    except Exception as e:
-        print(f"[ERROR] Error clearing favorites: {e}")
+    except Exception:
+        logger.exception("Error clearing favorites")
         return False
-    finally:
-        conn.close()
 
 def list_favorites(user_id: int) -> list[str]:
     """
@@ -240,28 +337,11 @@ def list_favorites(user_id: int) -> list[str]:
     Returns:
         List of recipe names that are marked as favorites
     """
-    print(f"[DEBUG] list_favorites called for user_id={user_id}")
     conn = get_connection()
     try:
-        # First, verify the table structure
         cur = conn.cursor()
         
-        # Ensure the is_fav column exists
-        cur.execute("PRAGMA table_info(recipes)")
-        columns = [col[1] for col in cur.fetchall()]
-        
-        if 'is_fav' not in columns:
-            print("[WARNING] 'is_fav' column not found in recipes table")
-            try:
-                cur.execute("ALTER TABLE recipes ADD COLUMN is_fav BOOLEAN DEFAULT 0")
-                conn.commit()
-                print("[DEBUG] Successfully added 'is_fav' column")
-            except Exception as e:
-                print(f"[ERROR] Failed to add 'is_fav' column: {e}")
-                return []
-        
         # Query for favorites - ensure we're only getting non-empty names
-        print(f"[DEBUG] Querying favorites for user_id={user_id}")
         cur.execute(
             "SELECT name FROM recipes WHERE user_id = ? AND is_fav = 1 AND name IS NOT NULL AND name != ''",
             (user_id,)
@@ -270,41 +350,214 @@ def list_favorites(user_id: int) -> list[str]:
         # Clean up the recipe names and filter out any empty ones
         recipes = [row[0].strip() for row in cur.fetchall() if row[0] and row[0].strip()]
         
-        # Debug output
-        print(f"[DEBUG] Found {len(recipes)} favorites: {recipes}")
+        logger.debug("Found %d favorites for user %s: %s", len(recipes), user_id, recipes)
         
-        # Verify the data in the database
-        cur.execute("SELECT id, name, is_fav FROM recipes WHERE user_id = ?", (user_id,))
-        all_recipes = cur.fetchall()
-        print(f"[DEBUG] All recipes for user {user_id}: {[(r[1], r[2]) for r in all_recipes]}")
+        # Cross-check against every recipe, only when someone is looking
+        if logger.isEnabledFor(logging.DEBUG):
+            cur.execute("SELECT name, is_fav FROM recipes WHERE user_id = ?", (user_id,))
+            logger.debug("All recipes for user %s: %s", user_id, cur.fetchall())
         
         return recipes
-    except Exception as e:
-        print(f"[ERROR] Error in list_favorites: {e}")
-        import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Error in list_favorites")
         return []
-    finally:
-        conn.close()
+
+def cached_favorites_page(user_id: int, direction: str = "next", cursor: int | None = None):
+    """Return a page from the in-process cache, or None if not cached."""
+    version = _favorites_versions.get(user_id, 0)
+    return _favorites_pages.get((user_id, version, direction, cursor))
+
+def list_favorites_page(
+    user_id: int,
+    direction: str = "next",
+    cursor: int | None = None,
+    limit: int = FAVORITES_PAGE_SIZE,
+) -> tuple[list[tuple[int, str]], int | None, int | None]:
+    """
+    Get one page of a user's favorites, newest first, using keyset pagination.
+    
+    Args:
+        user_id: The ID of the user
+        direction: "next" for older favorites than cursor, "prev" for newer
+        cursor: Recipe id the page starts after; None for the first page
+        limit: Page size
+        
+    Returns:
+        (items, prev_cursor, next_cursor) where items are (recipe_id, name)
+        tuples and a cursor is None when there is no page in that direction
+    """
+    version = _favorites_versions.get(user_id, 0)
+    cache_key = (user_id, version, direction, cursor)
+    
+    conn = get_connection()
+    if direction == "prev" and cursor is not None:
+        rows = conn.execute(
+            """
+            SELECT id, name FROM recipes
+             WHERE user_id = ? AND is_fav = 1 AND id > ?
+             ORDER BY id ASC LIMIT ?
+            """,
+            (user_id, cursor, limit + 1)
+        ).fetchall()
+        if len(rows) <= limit:
+            # Back at the newest favorites: show a full first page instead
+            return list_favorites_page(user_id, limit=limit)
+        items = rows[:limit][::-1]
+        has_prev, has_next = True, True
+    else:
+        rows = conn.execute(
+            """
+            SELECT id, name FROM recipes
+             WHERE user_id = ? AND is_fav = 1 AND id < ?
+             ORDER BY id DESC LIMIT ?
+            """,
+            (user_id, cursor if cursor is not None else _MAX_ROWID, limit + 1)
+        ).fetchall()
+        items = rows[:limit]
+        has_prev, has_next = cursor is not None and bool(items), len(rows) > limit
+    
+    page = (
+        items,
+        items[0][0] if has_prev else None,
+        items[-1][0] if has_next else None,
+    )
+    _favorites_pages.put(cache_key, page)
+    return page
 
 def get_recipe(user_id: int, name: str) -> str | None:
     conn = get_connection()
     cur  = conn.execute(
-        "SELECT body FROM recipes WHERE user_id=? AND name=?",
+        """
+        SELECT b.codec, b.dict_id, b.data
+          FROM recipes r JOIN recipe_bodies b ON b.hash = r.body_hash
+         WHERE r.user_id = ? AND r.name = ?
+        """,
         (user_id, name)
     )
-    row = cur.fetchone(); conn.close()
-    return row[0] if row else None
+    row = cur.fetchone()
+    return decode_body(conn, *row) if row else None
+
+def get_recipe_by_id(user_id: int, recipe_id: int) -> tuple[str, str] | None:
+    """Return (name, body) of one of the user's recipes, or None."""
+    conn = get_connection()
+    row = conn.execute(
+        """
+        SELECT r.name, b.codec, b.dict_id, b.data
+          FROM recipes r JOIN recipe_bodies b ON b.hash = r.body_hash
+         WHERE r.user_id = ? AND r.id = ?
+        """,
+        (user_id, recipe_id)
+    ).fetchone()
+    return (row[0], decode_body(conn, *row[1:])) if row else None
+
+def get_recipe_ingredients(recipe_id: int) -> list[str]:
+    """Ingredient lines parsed from a recipe at save time, in order."""
+    rows = get_connection().execute(
+        "SELECT item FROM recipe_ingredients WHERE recipe_id = ? ORDER BY position",
+        (recipe_id,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+def filter_recipes(
+    user_id: int,
+    max_kcal: float | None = None,
+    max_minutes: int | None = None,
+    max_budget: float | None = None,
+    favorites_only: bool = True,
+    limit: int = 10,
+) -> list[tuple[int, str]]:
+    """Return (id, name) of recipes within the given limits, newest first.
+
+    Recipes whose value couldn't be parsed never match a limit on it.
+    """
+    clauses = ["user_id = ?"]
+    params: list = [user_id]
+    if favorites_only:
+        clauses.append("is_fav = 1")
+    for column, bound in (("kcal", max_kcal), ("total_minutes", max_minutes), ("budget_thb", max_budget)):
+        if bound is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(bound)
+    params.append(limit)
+    rows = get_connection().execute(
+        f"SELECT id, name FROM recipes WHERE {' AND '.join(clauses)} ORDER BY id DESC LIMIT ?",
+        params
+    ).fetchall()
+    return [(r[0], r[1]) for r in rows]
+
+def _fts_query(user_id: int, terms: list[str], operator: str = " ", prefix: bool = True) -> str:
+    # Quote every term so user input can't inject FTS5 syntax; * = prefix match
+    star = "*" if prefix else ""
+    text = operator.join(f'"{t}"{star}' for t in terms)
+    return f'user_id:"{int(user_id)}" AND {{name body}}:({text})'
+
+def _closest_terms(conn: sqlite3.Connection, term: str) -> list[str]:
+    # Only compare against indexed terms sharing the first letter. Reading
+    # fts5vocab walks every doclist, so the term lists are cached for a while.
+    first = term[0]
+    cached = _vocab_cache.get(first)
+    if cached is None or cached[0] < time.monotonic():
+        terms = [row[0] for row in conn.execute(
+            "SELECT term FROM recipes_fts_vocab WHERE term >= ? AND term < ?",
+            (first, chr(ord(first) + 1))
+        )]
+        cached = (time.monotonic() + VOCAB_CACHE_TTL, terms)
+        _vocab_cache.put(first, cached)
+    candidates = [t for t in cached[1] if abs(len(t) - len(term)) <= 2]
+    return difflib.get_close_matches(term, candidates, n=3, cutoff=0.7)
+
+def search_recipes(user_id: int, query: str, limit: int = 10) -> list[tuple[int, str]]:
+    """
+    Full-text search over a user's recipe titles and bodies.
+    
+    Tries, in order: every term as a prefix, any term as a prefix, and
+    finally typo-corrected terms. Matches in the title weigh more than
+    matches in the body.
+    
+    Args:
+        user_id: The ID of the user
+        query: Free-text search terms
+        limit: Maximum number of results
+        
+    Returns:
+        List of (recipe_id, name) tuples, best match first
+    """
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return []
+    
+    conn = get_connection()
+    # The index is contentless, so names come from recipes
+    sql = """
+        SELECT r.id, r.name
+          FROM recipes_fts f JOIN recipes r ON r.id = f.rowid
+         WHERE recipes_fts MATCH ?
+         ORDER BY bm25(recipes_fts, 10.0, 1.0, 0.0)
+         LIMIT ?
+    """
+    attempts = [_fts_query(user_id, terms), _fts_query(user_id, terms, " OR ")]
+    for match in attempts:
+        rows = conn.execute(sql, (match, limit)).fetchall()
+        if rows:
+            return rows
+    
+    # Fuzzy fallback: swap each term for its closest indexed spellings
+    corrected = [
+        t for term in terms if term.isalpha() and len(term) > 2
+        for t in _closest_terms(conn, term)
+    ]
+    if not corrected:
+        return []
+    match = _fts_query(user_id, corrected, " OR ", prefix=False)
+    return conn.execute(sql, (match, limit)).fetchall()
 
 def set_user_preferences(user_id: int, prefs: UserPreferences):
-    print(f"[DEBUG] Setting preferences for user {user_id}")
-    print(f"[DEBUG] Preferences: {prefs}")
+    logger.debug("Setting preferences for user %s: %s", user_id, prefs)
     
     conn = get_connection()
     cur = conn.cursor()
     
     dietary_str = ",".join(prefs.dietary_restrictions) if prefs.dietary_restrictions else ""
-    print(f"[DEBUG] Dietary string to save: {dietary_str}")
     
     try:
         cur.execute("""
@@ -319,10 +572,9 @@ def set_user_preferences(user_id: int, prefs: UserPreferences):
             prefs.budget_range,
             user_id
         ))
-        print(f"[DEBUG] Rows updated: {cur.rowcount}")
 
         if cur.rowcount == 0:
-            print("[DEBUG] No existing user found, inserting new record")
+            logger.debug("No existing user found, inserting new record")
             dietary_str = ",".join(prefs.dietary_restrictions) if prefs.dietary_restrictions else ""
             cur.execute("""
                 INSERT INTO users (user_id, dietary, skill, budget)
@@ -333,17 +585,52 @@ def set_user_preferences(user_id: int, prefs: UserPreferences):
                 prefs.skill_level,
                 prefs.budget_range
             ))
-            print("[DEBUG] Inserted new user record")
 
-    except Exception as e:
-        print(f"[DEBUG] An error occurred: {e}")
-    finally:
         conn.commit()
-        conn.close()
+        # Cache exactly what a fresh read of this row would return
+        _cache_written_preferences(user_id, _row_to_preferences(dietary_str, prefs.skill_level, prefs.budget_range))
+
+    except Exception:
+        logger.exception("Error saving preferences for user %s", user_id)
+        conn.commit()
+        _cache_written_preferences(user_id, None)
+
+def _row_to_preferences(dietary: str | None, skill: str | None, budget: str | None) -> UserPreferences:
+    if not any([dietary, skill, budget]):
+        # Default values for new users
+        return UserPreferences(
+            dietary_restrictions=[],
+            skill_level="beginner",
+            budget_range="medium"
+        )
+    return UserPreferences(
+        dietary_restrictions=dietary.split(",") if dietary else [],
+        skill_level=skill or "beginner",
+        budget_range=budget or "medium"
+    )
+
+def cached_user_preferences(user_id: int) -> UserPreferences | None:
+    """Return preferences from the in-process cache, or None if not cached."""
+    return _prefs_cache.get(user_id)
+
+def preferences_cache_stats() -> dict:
+    """Size and hit-rate counters for the preferences cache."""
+    return _prefs_cache.stats()
+
+def favorites_cache_stats() -> dict:
+    """Size and hit-rate counters for the rendered favorites pages."""
+    return _favorites_pages.stats()
 
 def get_user_preferences(user_id: int) -> UserPreferences:
-    print(f"[DEBUG] Getting preferences for user {user_id}")
-    conn = None
+    prefs = cached_user_preferences(user_id)
+    if prefs is not None:
+        return prefs
+    return load_user_preferences(user_id)
+
+def load_user_preferences(user_id: int) -> UserPreferences:
+    """Read preferences from the database and refresh the cache."""
+    logger.debug("Loading preferences for user %s", user_id)
+    version = _prefs_versions.get(user_id, 0)
     try:
         conn = get_connection()
         cur = conn.cursor()
@@ -354,64 +641,300 @@ def get_user_preferences(user_id: int) -> UserPreferences:
         """, (user_id,))
 
         row = cur.fetchone()
-        print(f"[DEBUG] Retrieved row: {row}")
-
-        # Default values for new users
-        default_prefs = UserPreferences(
-            dietary_restrictions=[],
-            skill_level="beginner",
-            budget_range="medium"
-        )
-
-        if not row or not any([row[1], row[2], row[3]]):
-            print("[DEBUG] No preferences found, returning defaults")
-            return default_prefs
 
-        dietary = row[1].split(",") if row[1] else []
-        preferences = UserPreferences(
-            dietary_restrictions=dietary,
-            skill_level=row[2] or "beginner",
-            budget_range=row[3] or "medium"
-        )
-        print(f"[DEBUG] Returning preferences: {preferences}")
+        preferences = _row_to_preferences(*row[1:]) if row else _row_to_preferences(None, None, None)
+        logger.debug("Loaded preferences for user %s: %s", user_id, preferences)
+        with _prefs_lock:
+            # A write committed since we read would be overwritten with older data
+            if _prefs_versions.get(user_id, 0) == version:
+                _prefs_cache.put(user_id, preferences)
         return preferences
 
-    except Exception as e:
-        print(f"[DEBUG] Error getting preferences: {e}")
+    except Exception:
+        logger.exception("Error getting preferences for user %s", user_id)
         # Return default preferences on error
         return UserPreferences(
             dietary_restrictions=[],
             skill_level="beginner",
             budget_range="medium"
         )
-    finally:
-        if conn:
-            conn.close()
 
 def set_recipe_request(user_id: int, req: RecipeRequest):
-    print(f"[DEBUG] Saving recipe request for user {user_id}: {req}")
-    conn = None
+    """Queue a recipe request for the audit log; returns without touching SQLite."""
+    logger.debug("Queueing recipe request for user %s: %s", user_id, req)
+    _audit_log.append((
+        user_id,
+        req.cuisine,
+        req.meal_type,
+        req.servings,
+        req.time_limit,
+        ",".join(req.available_ingredients) if hasattr(req, 'available_ingredients') and req.available_ingredients else "",
+        # Same format as CURRENT_TIMESTAMP, taken now rather than at flush time
+        time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+    ))
+
+def insert_recipe_requests(rows: Sequence[tuple]):
+    """Write a batch of audit-log rows in a single transaction."""
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO recipe_requests (user_id, cuisine, meal, servings, time_limit, ingredients, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    logger.debug("Wrote %d recipe requests", len(rows))
+
+# Audit-log rows are buffered and written off the request path
+_audit_log = AuditLogWriter(
+    insert_recipe_requests,
+    batch_size=AUDIT_BATCH_SIZE,
+    flush_interval=AUDIT_FLUSH_INTERVAL,
+    name="recipe-requests-writer",
+)
+
+def flush_audit_log(timeout: float | None = None) -> bool:
+    """Block until every queued recipe request has been written."""
+    return _audit_log.flush(timeout)
+
+def audit_log_pending() -> dict:
+    """Rows waiting in each buffered log."""
+    return {"recipe_requests": _audit_log.pending, "llm_usage": _usage_log.pending}
+
+def close_audit_log():
+    """Flush queued audit rows and stop the writer threads."""
+    _audit_log.close()
+    _usage_log.close()
+
+def record_llm_usage(row: tuple):
+    """Queue an llm_usage row (see insert_llm_usage for the column order)."""
+    _usage_log.append(row)
+
+def insert_llm_usage(rows: Sequence[tuple]):
+    """Write a batch of chat-completion usage rows in a single transaction."""
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO llm_usage (user_id, model, prompt_tokens_est, prompt_tokens,
+                                   completion_tokens, cached_tokens, ttft_ms, latency_ms, created_at,
+                                   purpose)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    logger.debug("Wrote %d llm usage rows", len(rows))
+
+_usage_log = AuditLogWriter(
+    insert_llm_usage,
+    batch_size=AUDIT_BATCH_SIZE,
+    flush_interval=AUDIT_FLUSH_INTERVAL,
+    name="llm-usage-writer",
+)
+
+def llm_usage_summary(since: float) -> dict:
+    """Token and latency totals for completions created after since (epoch seconds)."""
+    _usage_log.flush()
+    row = get_connection().execute("""
+        SELECT COUNT(*),
+               COALESCE(SUM(prompt_tokens_est), 0),
+               COALESCE(SUM(prompt_tokens), 0),
+               COALESCE(SUM(completion_tokens), 0),
+               COALESCE(SUM(cached_tokens), 0),
+               AVG(ttft_ms),
+               AVG(latency_ms)
+        FROM llm_usage WHERE created_at >= ?
+    """, (since,)).fetchone()
+    keys = ("requests", "prompt_tokens_est", "prompt_tokens", "completion_tokens",
+            "cached_tokens", "avg_ttft_ms", "avg_latency_ms")
+    return dict(zip(keys, row))
+
+def llm_tokens_since(since: float, purpose: str) -> int:
+    """Billed tokens (estimated where the API reported none) spent on purpose since then."""
+    _usage_log.flush()
+    row = get_connection().execute("""
+        SELECT COALESCE(SUM(COALESCE(prompt_tokens, prompt_tokens_est) + COALESCE(completion_tokens, 0)), 0)
+        FROM llm_usage WHERE purpose = ? AND created_at >= ?
+    """, (purpose, since)).fetchone()
+    return row[0]
+
+def load_bot_state(kind: str) -> dict[str, str]:
+    """All saved (key -> JSON data) entries of one kind, see database.persistence."""
+    rows = get_connection().execute(
+        "SELECT key, data FROM bot_state WHERE kind = ?", (kind,)
+    ).fetchall()
+    return dict(rows)
+
+def write_bot_state(upserts: Sequence[tuple[str, str, str]], deletes: Sequence[tuple[str, str]]):
+    """Apply (kind, key, data) upserts and (kind, key) deletes in one transaction."""
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO bot_state (kind, key, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(kind, key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+            """,
+            [(kind, key, data, now) for kind, key, data in upserts]
+        )
+        conn.executemany("DELETE FROM bot_state WHERE kind = ? AND key = ?", deletes)
+    logger.debug("Wrote %d bot state rows, deleted %d", len(upserts), len(deletes))
+
+def get_cached_recipe(key: str, ttl: int) -> str | None:
+    """
+    Look up a cached recipe body and mark it as recently used.
+    
+    Args:
+        key: Cache key produced by the OpenAI service
+        ttl: Maximum age of an entry in seconds
+        
+    Returns:
+        The cached recipe text, or None on a miss or expired entry
+    """
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute(
+            """
+            SELECT b.codec, b.dict_id, b.data FROM recipe_cache c
+              JOIN recipe_bodies b ON b.hash = c.body_hash
+             WHERE c.key = ? AND c.created_at >= ?
+            """,
+            (key, now - ttl)
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE recipe_cache SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                (now, key)
+            )
+    return decode_body(conn, *row) if row else None
+
+def put_cached_recipe(key: str, body: str, ttl: int, max_entries: int):
+    """
+    Store a generated recipe in the cache, evicting expired entries and the
+    least recently used ones beyond max_entries.
+    
+    Args:
+        key: Cache key produced by the OpenAI service
+        body: The full recipe text
+        ttl: Maximum age of an entry in seconds
+        max_entries: Upper bound on the number of cached recipes
+    """
+    now = time.time()
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO recipe_requests (user_id, cuisine, meal, servings, time_limit, ingredients)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            user_id,
-            req.cuisine,
-            req.meal_type,
-            req.servings,
-            req.time_limit,
-            ",".join(req.available_ingredients) if hasattr(req, 'available_ingredients') and req.available_ingredients else ""
-        ))
-        conn.commit()
-        print("[DEBUG] Recipe request saved successfully")
-    except Exception as e:
-        print(f"[DEBUG] Error saving recipe request: {e}")
-        if conn:
-            conn.rollback()
-        raise
-    finally:
-        if conn:
-            conn.close()
+        with transaction() as conn:
+            old = conn.execute("SELECT body_hash FROM recipe_cache WHERE key = ?", (key,)).fetchall()
+            conn.execute(
+                """
+                INSERT INTO recipe_cache (key, body_hash, created_at, last_used, hits)
+                VALUES (?, ?, ?, ?, 0)
+                ON CONFLICT(key) DO UPDATE SET
+                    body_hash = excluded.body_hash,
+                    created_at = excluded.created_at,
+                    last_used = excluded.last_used
+                """,
+                (key, store_body(conn, body), now, now)
+            )
+            old += conn.execute(
+                "DELETE FROM recipe_cache WHERE created_at < ? RETURNING body_hash", (now - ttl,)
+            ).fetchall()
+            old += conn.execute(
+                """
+                DELETE FROM recipe_cache WHERE key IN (
+                    SELECT key FROM recipe_cache
+                    ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?
+                )
+                RETURNING body_hash
+                """,
+                (max_entries,)
+            ).fetchall()
+            for (h,) in set(old):
+                release_body(conn, h)
+    except Exception:
+        logger.exception("Error caching recipe")
+
+# ─── PRE-GENERATED CANDIDATES ────────────────────────────────────────────────
+def last_user_generation() -> float | None:
+    """When any process last took a recipe request or finished a user-facing completion.
+
+    Requests are logged when submitted, completions when they finish, so
+    together they also see generations still running in other workers.
+    """
+    _audit_log.flush()
+    _usage_log.flush()
+    row = get_connection().execute("""
+        SELECT MAX(
+            COALESCE((SELECT CAST(strftime('%s', timestamp) AS REAL) FROM recipe_requests
+                      ORDER BY id DESC LIMIT 1), 0),
+            COALESCE((SELECT MAX(created_at) FROM llm_usage WHERE purpose IS NULL), 0)
+        )
+    """).fetchone()
+    return row[0] or None
+
+def pregeneration_users(since: float, min_requests: int, fresh_after: float, limit: int) -> list[int]:
+    """Users with at least min_requests recipe requests since then and no candidate newer than fresh_after.
+
+    Most active first.
+    """
+    _audit_log.flush()
+    since_ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(since))
+    rows = get_connection().execute("""
+        SELECT r.user_id
+        FROM recipe_requests r
+        WHERE r.timestamp >= ?
+          AND NOT EXISTS (
+            SELECT 1 FROM recipe_candidates c
+            WHERE c.user_id = r.user_id AND c.created_at >= ?
+          )
+        GROUP BY r.user_id
+        HAVING COUNT(*) >= ?
+        ORDER BY COUNT(*) DESC, MAX(r.timestamp) DESC
+        LIMIT ?
+    """, (since_ts, fresh_after, min_requests, limit)).fetchall()
+    return [row[0] for row in rows]
+
+def recent_recipe_requests(user_id: int, limit: int = 20) -> list[tuple[str, str, int, int, str]]:
+    """(cuisine, meal, servings, time_limit, ingredients) for the user's latest requests, newest first."""
+    return get_connection().execute("""
+        SELECT cuisine, meal, servings, time_limit, ingredients
+        FROM recipe_requests
+        WHERE user_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """, (user_id, limit)).fetchall()
+
+def put_recipe_candidate(user_id: int, req: RecipeRequest, ingredients: str, profile: str, body: str):
+    """Store a pre-generated recipe, replacing any for the same request shape."""
+    with transaction() as conn:
+        old = conn.execute("""
+            DELETE FROM recipe_candidates
+            WHERE user_id = ? AND cuisine = ? AND meal = ? AND servings = ? AND time_limit = ?
+            RETURNING body_hash
+        """, (user_id, req.cuisine, req.meal_type, req.servings, req.time_limit)).fetchall()
+        conn.execute("""
+            INSERT INTO recipe_candidates
+                (user_id, cuisine, meal, servings, time_limit, ingredients, profile, body_hash, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, req.cuisine, req.meal_type, req.servings, req.time_limit,
+              ingredients, profile, store_body(conn, body), time.time()))
+        for (h,) in set(old):
+            release_body(conn, h)
+
+def take_recipe_candidate(req: RecipeRequest, ingredients: Sequence[str], profile: str, ttl: int) -> str | None:
+    """Claim a pre-generated recipe that fits req, removing it from the pool.
+
+    A candidate fits when the request shape and profile are the same and it
+    was written for ingredients the user has now listed (a subset).
+    """
+    have = set(ingredients)
+    with transaction() as conn:
+        expired = conn.execute(
+            "DELETE FROM recipe_candidates WHERE created_at < ? RETURNING body_hash", (time.time() - ttl,)
+        ).fetchall()
+        for (h,) in set(expired):
+            release_body(conn, h)
+        rows = conn.execute("""
+            SELECT id, ingredients, body_hash FROM recipe_candidates
+            WHERE user_id = ? AND cuisine = ? AND meal = ? AND servings = ? AND time_limit = ?
+              AND profile = ?
+            ORDER BY created_at DESC
+        """, (req.user_id, req.cuisine, req.meal_type, req.servings, req.time_limit, profile)).fetchall()
+        for candidate_id, needed, h in rows:
+            if set(filter(None, needed.split(","))) <= have:
+                body = load_body(conn, h)
+                conn.execute("DELETE FROM recipe_candidates WHERE id = ?", (candidate_id,))
+                release_body(conn, h)
+                return body
+    return None
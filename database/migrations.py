@@ -0,0 +1,410 @@
+# database/migrations.py
+"""Schema migrations tracked with PRAGMA user_version.
+
+Each migration runs once, in order, inside its own transaction. To change
+the schema, append a new function decorated with @migration; never edit one
+that has already shipped.
+"""
+import logging
+import sqlite3
+from typing import Callable
+
+from database.bodies import load_body, store_body
+from utils.recipe_parser import clean_recipe_name, parse_recipe, recipe_title
+
+logger = logging.getLogger(__name__)
+
+Migration = Callable[[sqlite3.Connection], None]
+
+MIGRATIONS: list[Migration] = []
+
+def migration(fn: Migration) -> Migration:
+    MIGRATIONS.append(fn)
+    return fn
+
+def _columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+# ─── MIGRATIONS ──────────────────────────────────────────────────────────────
+@migration
+def base_schema(conn: sqlite3.Connection):
+    """Tables the bot has always had; safe on databases created before migrations."""
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        dietary TEXT,
+        skill TEXT,
+        budget TEXT
+      )
+    """)
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS recipes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        body TEXT NOT NULL,
+        is_fav BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(user_id, name) ON CONFLICT REPLACE,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+      )
+    """)
+    # Very old databases predate favorites
+    if 'is_fav' not in _columns(conn, "recipes"):
+        conn.execute("ALTER TABLE recipes ADD COLUMN is_fav BOOLEAN DEFAULT 0")
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS recipe_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        cuisine TEXT,
+        meal TEXT,
+        servings INTEGER,
+        time_limit INTEGER,
+        ingredients TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+      )
+    """)
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS recipe_cache (
+        key TEXT PRIMARY KEY,
+        body TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0
+      )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recipe_cache_last_used ON recipe_cache(last_used)")
+
+@migration
+def hot_path_indexes(conn: sqlite3.Connection):
+    """Covering indexes for /favorites and the per-user audit-log history.
+
+    /specific is served by the UNIQUE(user_id, name) index.
+    """
+    conn.execute("""
+      CREATE INDEX IF NOT EXISTS idx_recipes_user_fav
+        ON recipes(user_id, is_fav, name)
+    """)
+    conn.execute("""
+      CREATE INDEX IF NOT EXISTS idx_recipe_requests_user_ts
+        ON recipe_requests(user_id, timestamp, cuisine, meal, servings, time_limit)
+    """)
+
+@migration
+def recipes_full_text(conn: sqlite3.Connection):
+    """FTS5 index over recipe titles and bodies, kept in sync by triggers.
+
+    The index uses recipes as its external content table, so text is not
+    stored twice. user_id is indexed too so a search only ranks the owner's
+    recipes. fts5vocab exposes the indexed terms for typo correction.
+    """
+    conn.execute("""
+      CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+        name, body, user_id,
+        content='recipes', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2',
+        prefix='2 3'
+      )
+    """)
+    conn.execute("""
+      CREATE TRIGGER IF NOT EXISTS recipes_fts_ai AFTER INSERT ON recipes BEGIN
+        INSERT INTO recipes_fts(rowid, name, body, user_id) VALUES (new.id, new.name, new.body, new.user_id);
+      END
+    """)
+    conn.execute("""
+      CREATE TRIGGER IF NOT EXISTS recipes_fts_ad AFTER DELETE ON recipes BEGIN
+        INSERT INTO recipes_fts(recipes_fts, rowid, name, body, user_id) VALUES ('delete', old.id, old.name, old.body, old.user_id);
+      END
+    """)
+    conn.execute("""
+      CREATE TRIGGER IF NOT EXISTS recipes_fts_au AFTER UPDATE OF name, body, user_id ON recipes BEGIN
+        INSERT INTO recipes_fts(recipes_fts, rowid, name, body, user_id) VALUES ('delete', old.id, old.name, old.body, old.user_id);
+        INSERT INTO recipes_fts(rowid, name, body, user_id) VALUES (new.id, new.name, new.body, new.user_id);
+      END
+    """)
+    conn.execute("INSERT INTO recipes_fts(recipes_fts) VALUES ('rebuild')")
+    conn.execute("""
+      CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts_vocab USING fts5vocab(recipes_fts, 'row')
+    """)
+
+@migration
+def favorites_keyset_index(conn: sqlite3.Connection):
+    """Favorites are paged by id, and names are cleaned once at write time.
+
+    (user_id, is_fav, id, name) serves both keyset pages and the plain
+    favorites list, so it replaces the (user_id, is_fav, name) index.
+    """
+    conn.execute("DROP INDEX IF EXISTS idx_recipes_user_fav")
+    conn.execute("""
+      CREATE INDEX IF NOT EXISTS idx_recipes_user_fav_id
+        ON recipes(user_id, is_fav, id, name)
+    """)
+    # Older rows were saved before names were fully cleaned. OR IGNORE keeps
+    # the original if the cleaned name would collide with another recipe.
+    rows = conn.execute("SELECT id, name FROM recipes").fetchall()
+    updates = [(clean_recipe_name(name), rid) for rid, name in rows if clean_recipe_name(name) != name]
+    conn.executemany("UPDATE OR IGNORE recipes SET name = ? WHERE id = ?", updates)
+
+@migration
+def llm_usage(conn: sqlite3.Connection):
+    """One row per chat completion: estimated vs. billed tokens and latency."""
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS llm_usage (
+        id                INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id           INTEGER,
+        model             TEXT NOT NULL,
+        prompt_tokens_est INTEGER NOT NULL,
+        prompt_tokens     INTEGER,
+        completion_tokens INTEGER,
+        cached_tokens     INTEGER,
+        ttft_ms           REAL,
+        latency_ms        REAL,
+        created_at        REAL NOT NULL
+      )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage(created_at)")
+
+@migration
+def recipe_details(conn: sqlite3.Connection):
+    """Typed columns parsed from the body once, so filters are plain SQL.
+
+    Nutrition, time and budget live on recipes; ingredients get a side
+    table with one row per line. Existing recipes are parsed here.
+    """
+    existing = _columns(conn, "recipes")
+    for column, kind in [
+        ("total_minutes", "INTEGER"),
+        ("kcal",          "REAL"),
+        ("protein_g",     "REAL"),
+        ("carbs_g",       "REAL"),
+        ("fat_g",         "REAL"),
+        ("budget_thb",    "REAL"),
+    ]:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE recipes ADD COLUMN {column} {kind}")
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS recipe_ingredients (
+        recipe_id INTEGER NOT NULL,
+        position  INTEGER NOT NULL,
+        item      TEXT NOT NULL,
+        PRIMARY KEY (recipe_id, position)
+      ) WITHOUT ROWID
+    """)
+    conn.execute("""
+      CREATE INDEX IF NOT EXISTS idx_recipes_user_fav_kcal
+        ON recipes(user_id, is_fav, kcal)
+    """)
+    conn.execute("""
+      CREATE INDEX IF NOT EXISTS idx_recipes_user_fav_minutes
+        ON recipes(user_id, is_fav, total_minutes)
+    """)
+
+    for rid, body in conn.execute("SELECT id, body FROM recipes").fetchall():
+        d = parse_recipe(body)
+        conn.execute(
+            """
+            UPDATE recipes SET total_minutes = ?, kcal = ?, protein_g = ?,
+                               carbs_g = ?, fat_g = ?, budget_thb = ?
+            WHERE id = ?
+            """,
+            (d.total_minutes, d.kcal, d.protein_g, d.carbs_g, d.fat_g, d.budget_thb, rid)
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO recipe_ingredients (recipe_id, position, item) VALUES (?, ?, ?)",
+            [(rid, i, item) for i, item in enumerate(d.ingredients)]
+        )
+
+@migration
+def compressed_recipe_bodies(conn: sqlite3.Connection):
+    """Move bodies into recipe_bodies, compressed and keyed by content hash.
+
+    recipes_fts can no longer read bodies from recipes, so it becomes a
+    contentless index maintained by save_recipe instead of triggers. The
+    dropped column's space is reclaimed by the VACUUM in migrate().
+    """
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS compression_dicts (
+        id         INTEGER PRIMARY KEY,
+        codec      INTEGER NOT NULL,
+        data       BLOB NOT NULL,
+        created_at REAL NOT NULL
+      )
+    """)
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS recipe_bodies (
+        hash    BLOB PRIMARY KEY,
+        codec   INTEGER NOT NULL,
+        dict_id INTEGER,
+        size    INTEGER NOT NULL,
+        data    BLOB NOT NULL
+      )
+    """)
+
+    for trigger in ("recipes_fts_ai", "recipes_fts_ad", "recipes_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS recipes_fts_vocab")
+    conn.execute("DROP TABLE IF EXISTS recipes_fts")
+    conn.execute("""
+      CREATE VIRTUAL TABLE recipes_fts USING fts5(
+        name, body, user_id,
+        content='',
+        tokenize='porter unicode61 remove_diacritics 2',
+        prefix='2 3'
+      )
+    """)
+    conn.execute("""
+      CREATE VIRTUAL TABLE recipes_fts_vocab USING fts5vocab(recipes_fts, 'row')
+    """)
+
+    if "body_hash" not in _columns(conn, "recipes"):
+        conn.execute("ALTER TABLE recipes ADD COLUMN body_hash BLOB")
+    rows = conn.execute("SELECT id, user_id, name, body FROM recipes").fetchall()
+    for rid, user_id, name, body in rows:
+        body = body or ""
+        conn.execute("UPDATE recipes SET body_hash = ? WHERE id = ?", (store_body(conn, body), rid))
+        conn.execute(
+            "INSERT INTO recipes_fts (rowid, name, body, user_id) VALUES (?, ?, ?, ?)",
+            (rid, name, body, user_id)
+        )
+    conn.execute("ALTER TABLE recipes DROP COLUMN body")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recipes_body_hash ON recipes(body_hash)")
+
+@migration
+def bot_state(conn: sqlite3.Connection):
+    """Conversation states and user_data saved by database.persistence.
+
+    kind is "user", "chat", "bot" or "conversation:<handler name>"; key is
+    the id (or JSON conversation key) and data is JSON.
+    """
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS bot_state (
+        kind       TEXT NOT NULL,
+        key        TEXT NOT NULL,
+        data       TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (kind, key)
+      ) WITHOUT ROWID
+    """)
+
+@migration
+def recipe_candidates(conn: sqlite3.Connection):
+    """Recipes generated ahead of time for a user's likely next request.
+
+    ingredients is the normalised, comma-joined list the recipe was written
+    for; profile fingerprints the preferences and prompt version it assumed.
+    llm_usage.purpose tells background generations apart for the spend budget.
+    """
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS recipe_candidates (
+        id          INTEGER PRIMARY KEY,
+        user_id     INTEGER NOT NULL,
+        cuisine     TEXT NOT NULL,
+        meal        TEXT NOT NULL,
+        servings    INTEGER NOT NULL,
+        time_limit  INTEGER NOT NULL,
+        ingredients TEXT NOT NULL,
+        profile     TEXT NOT NULL,
+        body        TEXT NOT NULL,
+        created_at  REAL NOT NULL
+      )
+    """)
+    conn.execute("""
+      CREATE INDEX IF NOT EXISTS idx_recipe_candidates_request
+        ON recipe_candidates(user_id, cuisine, meal, servings, time_limit)
+    """)
+    if "purpose" not in _columns(conn, "llm_usage"):
+        conn.execute("ALTER TABLE llm_usage ADD COLUMN purpose TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_purpose ON llm_usage(purpose, created_at)")
+
+@migration
+def name_untitled_recipes(conn: sqlite3.Connection):
+    """Give recipes saved with an empty name their title, or "Recipe #<id>".
+
+    The model's bare "1. Title:" line used to clean to '', so every untitled
+    recipe of a user shared one row. recipes_fts is contentless, so each
+    renamed row is deleted from it with its old text and indexed again.
+    """
+    rows = conn.execute(
+        "SELECT id, user_id, name, body_hash FROM recipes WHERE name = '' OR name IS NULL"
+    ).fetchall()
+    for rid, user_id, old_name, h in rows:
+        body = load_body(conn, h) or ""
+        name = recipe_title(body)
+        taken = conn.execute(
+            "SELECT 1 FROM recipes WHERE user_id = ? AND name = ?", (user_id, name)
+        ).fetchone()
+        if not name or taken:
+            name = f"Recipe #{rid}"
+        conn.execute("UPDATE OR ABORT recipes SET name = ? WHERE id = ?", (name, rid))
+        conn.execute(
+            "INSERT INTO recipes_fts (recipes_fts, rowid, name, body, user_id) VALUES ('delete', ?, ?, ?, ?)",
+            (rid, old_name or "", body, user_id)
+        )
+        conn.execute(
+            "INSERT INTO recipes_fts (rowid, name, body, user_id) VALUES (?, ?, ?, ?)",
+            (rid, name, body, user_id)
+        )
+    if rows:
+        logger.info("Named %d untitled recipes", len(rows))
+
+@migration
+def shared_cache_bodies(conn: sqlite3.Connection):
+    """recipe_cache and recipe_candidates keep their text in recipe_bodies too.
+
+    A generated recipe is usually cached and saved, so storing it raw in
+    the cache kept every body at least twice. Rows now point at the same
+    content-addressed, compressed body as the saved recipe.
+    """
+    for table, key in (("recipe_cache", "key"), ("recipe_candidates", "id")):
+        if "body" not in _columns(conn, table):
+            continue
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN body_hash BLOB")
+        rows = conn.execute(f"SELECT {key}, body FROM {table}").fetchall()
+        conn.executemany(
+            f"UPDATE {table} SET body_hash = ? WHERE {key} = ?",
+            [(store_body(conn, body or ""), k) for k, body in rows]
+        )
+        conn.execute(f"ALTER TABLE {table} DROP COLUMN body")
+        # release_body looks up every table referencing a body
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_body_hash ON {table}(body_hash)")
+
+# ─── RUNNER ──────────────────────────────────────────────────────────────────
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Migrations that drop columns; SQLite only returns the space on VACUUM
+VACUUM_AFTER = {"compressed_recipe_bodies", "shared_cache_bodies"}
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations and return the resulting schema version."""
+    # Fast path on every boot: a single PRAGMA read, no sqlite_master probes
+    version = schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    applied = set()
+    for number, fn in enumerate(MIGRATIONS, start=1):
+        # BEGIN IMMEDIATE takes the write lock up front, so when several
+        # processes start together only one of them applies each step.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < number:
+                logger.info("Applying migration %d: %s", number, fn.__name__)
+                fn(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+                applied.add(fn.__name__)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    if applied & VACUUM_AFTER:
+        # Outside any transaction; the file shrinks only now
+        try:
+            conn.execute("VACUUM")
+        except sqlite3.OperationalError as e:
+            logger.warning("VACUUM after migrating failed, run it later to reclaim space: %s", e)
+    return schema_version(conn)
@@ -0,0 +1,142 @@
+# database/persistence.py
+"""python-telegram-bot persistence stored in the bot's SQLite database.
+
+The Application hands over changed user_data and conversation states every
+update_interval seconds; SQLitePersistence skips entries whose JSON hasn't
+changed and writes the rest in one transaction on the DB writer thread.
+Rows are upserted per key, never rewritten wholesale, so several worker
+processes can share the file as long as each user is served by one worker.
+"""
+import asyncio
+import json
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import async_db, db
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+CHAT = "chat"
+BOT  = "bot"
+
+def _conversation_kind(name: str) -> str:
+    return f"conversation:{name}"
+
+class SQLitePersistence(BasePersistence):
+    """Stores user_data and conversation states (chat and bot data optional)."""
+
+    def __init__(
+        self,
+        store_data: PersistenceInput | None = None,
+        update_interval: float = 60,
+    ):
+        super().__init__(
+            store_data=store_data or PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        # Last JSON written per (kind, key), so unchanged data isn't rewritten
+        self._written: dict[tuple[str, str], str] = {}
+        self._pending: dict[tuple[str, str], str | None] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    # ─── loading ─────────────────────────────────────────────────────────────
+    async def _load(self, kind: str) -> dict[str, object]:
+        rows = await async_db.run_read(db.load_bot_state, kind)
+        for key, data in rows.items():
+            self._written[(kind, key)] = data
+        return {key: json.loads(data) for key, data in rows.items()}
+
+    async def get_user_data(self) -> dict[int, dict]:
+        return {int(k): v for k, v in (await self._load(USER)).items()}
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {int(k): v for k, v in (await self._load(CHAT)).items()}
+
+    async def get_bot_data(self) -> dict:
+        return (await self._load(BOT)).get("", {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        states = await self._load(_conversation_kind(name))
+        return {tuple(json.loads(key)): state for key, state in states.items()}
+
+    # ─── staging ─────────────────────────────────────────────────────────────
+    def _stage(self, kind: str, key: str, value):
+        """Queue a write (value None or empty deletes) unless it's unchanged."""
+        data = json.dumps(value, sort_keys=True) if value not in (None, {}) else None
+        if self._written.get((kind, key)) == data:
+            self._pending.pop((kind, key), None)
+            return
+        self._pending[(kind, key)] = data
+        # The Application updates every changed entry at once; one task
+        # collects them all and writes a single transaction.
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        await asyncio.sleep(0)
+        # Changes staged while a write was in flight go in the next batch
+        while self._pending and await self._write_pending():
+            pass
+
+    async def _write_pending(self) -> bool:
+        if not self._pending:
+            return True
+        pending, self._pending = self._pending, {}
+        upserts = [(kind, key, data) for (kind, key), data in pending.items() if data is not None]
+        deletes = [(kind, key) for (kind, key), data in pending.items() if data is None]
+        try:
+            await async_db.run_write(db.write_bot_state, upserts, deletes)
+        except Exception:
+            logger.exception("Error saving bot state; will retry on the next change")
+            # Keep newer staged values, retry the rest next time
+            self._pending = {**pending, **self._pending}
+            return False
+        for (kind, key), data in pending.items():
+            if data is None:
+                self._written.pop((kind, key), None)
+            else:
+                self._written[(kind, key)] = data
+        return True
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._stage(USER, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._stage(CHAT, str(chat_id), data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._stage(BOT, "", data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        self._stage(_conversation_kind(name), json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage(USER, str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage(CHAT, str(chat_id), None)
+
+    # Data is loaded once at startup; a user is always served by the same
+    # worker, so there's nothing newer in the database to refresh from.
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Write anything still staged (called on shutdown)."""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self._write_pending()
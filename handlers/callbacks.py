@@ -1,8 +1,14 @@
 # handlers/callbacks.py
 
+import logging
+
 from telegram import Update
 from telegram.ext import ContextTypes
-from database.db import set_favorite
+from database.async_db import set_favorite, list_favorites_page, get_recipe_by_id
+from handlers import conversations
+from utils.helpers import build_recipe_list_keyboard, split_message
+
+logger = logging.getLogger(__name__)
 
 
 async def budget_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -12,8 +18,7 @@ async def budget_choice_callback(update: Update, context: ContextTypes.DEFAULT_T
     context.user_data['budget'] = query.data
 
     # Now hand off to the onboard flow’s budget_choice
-    from handlers.conversations import budget_choice
-    return await budget_choice(update, context)
+    return await conversations.budget_choice(update, context)
 
 async def cuisine_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Delegate an inline-button tap to the cuisine_choice step."""
@@ -21,8 +26,7 @@ async def cuisine_choice_callback(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     context.user_data['cuisine'] = query.data
 
-    from handlers.conversations import cuisine_choice
-    return await cuisine_choice(update, context)
+    return await conversations.cuisine_choice(update, context)
 
 async def meal_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Delegate an inline-button tap to the meal_choice step."""
@@ -30,8 +34,7 @@ async def meal_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     context.user_data['meal'] = query.data
 
-    from handlers.conversations import meal_choice
-    return await meal_choice(update, context)
+    return await conversations.meal_choice(update, context)
 
 async def servings_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Delegate an inline-button tap to the servings_choice step."""
@@ -40,8 +43,7 @@ async def servings_choice_callback(update: Update, context: ContextTypes.DEFAULT
     # coerce to int, default 1 if non-digit
     context.user_data['servings'] = int(query.data) if query.data.isdigit() else 1
 
-    from handlers.conversations import servings_choice
-    return await servings_choice(update, context)
+    return await conversations.servings_choice(update, context)
 
 async def time_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Delegate an inline-button tap to the time_choice step."""
@@ -49,8 +51,7 @@ async def time_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     context.user_data['time'] = int(query.data)
 
-    from handlers.conversations import time_choice
-    return await time_choice(update, context)
+    return await conversations.time_choice(update, context)
 
 async def favorite_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -63,7 +64,7 @@ async def favorite_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = query.from_user.id
         
         # Update the favorite status
-        success = set_favorite(user_id, recipe_id, True)
+        success = await set_favorite(user_id, recipe_id, True)
         
         if success:
             await query.edit_message_text("⭐ Added to favorites!")
@@ -71,10 +72,47 @@ async def favorite_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text("❌ Could not add to favorites. Please try again.")
             
     except (ValueError, IndexError) as e:
-        print(f"[ERROR] Invalid callback data: {query.data}, error: {e}")
+        logger.warning("Invalid callback data: %r, error: %s", query.data, e)
         await query.edit_message_text("❌ Invalid request. Please try again.")
-    except Exception as e:
-        print(f"[ERROR] Error in favorite_callback: {e}")
-        import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
-        await query.edit_message_text("❌ An error occurred. Please try again.")
\ No newline at end of file
+    except Exception:
+        logger.exception("Error in favorite_callback")
+        await query.edit_message_text("❌ An error occurred. Please try again.")
+
+async def favorites_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Swap the /favorites message to the previous or next page."""
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        _, direction, cursor_str = query.data.split("|", 2)
+        cursor = int(cursor_str)
+    except ValueError:
+        logger.warning("Invalid callback data: %r", query.data)
+        return
+
+    items, prev_cursor, next_cursor = await list_favorites_page(query.from_user.id, direction, cursor)
+    if not items:
+        await query.edit_message_text("No favorites yet. Use ⭐ after a recipe.")
+        return
+    await query.edit_message_text(
+        "📚 Your favorites — tap one to open it",
+        reply_markup=build_recipe_list_keyboard(items, prev_cursor, next_cursor),
+    )
+
+async def open_recipe_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send the full recipe for a tapped favorites/search entry."""
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        recipe_id = int(query.data.split("|", 1)[1])
+    except (ValueError, IndexError):
+        logger.warning("Invalid callback data: %r", query.data)
+        return
+
+    found = await get_recipe_by_id(query.from_user.id, recipe_id)
+    if not found:
+        await query.message.reply_text("Recipe not found. It may have been replaced by a newer one.")
+        return
+    for chunk in split_message(found[1]):
+        await query.message.reply_text(chunk, disable_web_page_preview=True)
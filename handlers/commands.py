@@ -1,8 +1,31 @@
 # handlers/commands.py
 
-from telegram import Update
+import logging
+import re
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CommandHandler, ContextTypes
-from database.db import list_favorites, get_recipe, clear_favorites
+from config.default import MEALPLAN_MAX_DAYS, MEALPLAN_SERVINGS, MEALPLAN_TIME
+from database.async_db import (
+    list_favorites_page, get_recipe, get_recipe_by_id, clear_favorites, search_recipes,
+    filter_recipes, get_user_preferences, save_recipes,
+)
+from handlers.conversations import onboard_entry, recipe_entry, CUISINE_CHOICES
+from models.recipe_request import RecipeRequest
+from services.admission import AdmissionRejected
+from services.openai_service import generate_meal_plan
+from utils.helpers import build_recipe_list_keyboard, format_preferences, split_message
+from utils.recipe_parser import recipe_title
+
+logger = logging.getLogger(__name__)
+
+# "/filter 500kcal 30 min 200 thb" -> limits keyed by filter_recipes argument
+_FILTER_LIMIT = re.compile(r'(\d+(?:\.\d+)?)\s*(kcal|cal|calories|min|mins|minutes|thb|baht|฿)(?!\w)', re.IGNORECASE)
+_FILTER_UNITS = {
+    "kcal": "max_kcal", "cal": "max_kcal", "calories": "max_kcal",
+    "min": "max_minutes", "mins": "max_minutes", "minutes": "max_minutes",
+    "thb": "max_budget", "baht": "max_budget", "฿": "max_budget",
+}
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -14,17 +37,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/favorites — View your saved favorites\n"
         "/clear_favorites — Remove all favorites\n"
         "/specific <recipe name> — View a specific recipe\n"
+        "/search <words> — Search your saved recipes\n"
+        "/filter 500kcal 30min 200thb — Favorites within these limits\n"
+        "/mealplan [days] <ingredients> — A dinner for each day\n"
     )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await start(update, context)
 
 async def preferences(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from database.db    import get_user_preferences
-    from utils.helpers import format_preferences
-
     user_id = update.effective_user.id
-    prefs   = get_user_preferences(user_id)
+    prefs   = await get_user_preferences(user_id)
 
     if prefs:
         await update.message.reply_text(format_preferences(prefs))
@@ -34,54 +57,31 @@ async def preferences(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
 async def onboard_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from handlers.conversations import onboard_entry
     return await onboard_entry(update, context)
 
 async def recipe_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from handlers.conversations import recipe_entry
     return await recipe_entry(update, context)
 
 async def favorites(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    print(f"[DEBUG] Favorites command called by user {user_id}")
-    
-    # Get favorites from database
-    names = list_favorites(user_id)
-    print(f"[DEBUG] Retrieved favorites for user {user_id}: {names}")
     
-    # Debug: Check what's in the recipes table
-    from database.db import get_connection
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT name, is_fav FROM recipes WHERE user_id = ?", (user_id,))
-        recipes = cur.fetchall()
-        print(f"[DEBUG] All recipes for user {user_id}: {recipes}")
-    except Exception as e:
-        print(f"[ERROR] Error checking recipes table: {e}")
-    finally:
-        conn.close()
+    # First (newest) page; older pages come through favorites_page_callback
+    items, prev_cursor, next_cursor = await list_favorites_page(user_id)
+    logger.debug("Retrieved %d favorites for user %s", len(items), user_id)
     
-    if not names:
+    if not items:
         await update.message.reply_text("No favorites yet. Use ⭐ after a recipe.")
         return
     
-    # Clean up recipe names by removing numbers and dots at the start
-    import re
-    cleaned_names = []
-    for name in names:
-        # Remove any leading numbers followed by dots or spaces
-        cleaned = re.sub(r'^\d+[\.\s]*', '', name).strip()
-        cleaned_names.append(cleaned)
-    
-    # Create bullet points with cleaned names
-    bullets = "\n".join(f"• {name}" for name in cleaned_names)
-    await update.message.reply_text(f"📚 Your favorites\n{bullets}")
+    await update.message.reply_text(
+        "📚 Your favorites — tap one to open it",
+        reply_markup=build_recipe_list_keyboard(items, prev_cursor, next_cursor),
+    )
 
 async def clear_favorites_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Clear all favorites for the user."""
     user_id = update.effective_user.id
-    success = clear_favorites(user_id)
+    success = await clear_favorites(user_id)
     
     if success:
         await update.message.reply_text("✅ All favorites have been cleared.")
@@ -92,12 +92,135 @@ async def clear_favorites_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def specific(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         return await update.message.reply_text("Usage: /specific <recipe name>")
+    user_id = update.effective_user.id
     name = " ".join(context.args)
-    body = get_recipe(update.effective_user.id, name)
+    body = await get_recipe(user_id, name)
     if body:
-        await update.message.reply_text(body, disable_web_page_preview=True)
-    else:
-        await update.message.reply_text("Recipe not found. Check /favorites.")
+        for chunk in split_message(body):
+            await update.message.reply_text(chunk, disable_web_page_preview=True)
+        return
+
+    # No exact title match: fall back to the closest full-text hit
+    matches = await search_recipes(user_id, name, limit=1)
+    if not matches:
+        await update.message.reply_text("Recipe not found. Try /search or check /favorites.")
+        return
+    found = await get_recipe_by_id(user_id, matches[0][0])
+    if found:
+        await update.message.reply_text(f"🔎 Closest match: {found[0]}")
+        for chunk in split_message(found[1]):
+            await update.message.reply_text(chunk, disable_web_page_preview=True)
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ranked full-text search across the user's saved recipes."""
+    if not context.args:
+        return await update.message.reply_text("Usage: /search <words>")
+    user_id = update.effective_user.id
+    matches = await search_recipes(user_id, " ".join(context.args))
+    if not matches:
+        await update.message.reply_text("No recipes matched. Try fewer or different words.")
+        return
+
+    await update.message.reply_text(
+        "🔎 Matching recipes — tap one to open it",
+        reply_markup=build_recipe_list_keyboard(matches),
+    )
+
+async def filter_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Favorites at or under the given calories, minutes and/or THB budget."""
+    limits = {
+        _FILTER_UNITS[unit.lower()]: float(value)
+        for value, unit in _FILTER_LIMIT.findall(" ".join(context.args or []))
+    }
+    if not limits:
+        return await update.message.reply_text(
+            "Usage: /filter 500kcal 30min 200thb (any combination)"
+        )
+    user_id = update.effective_user.id
+    matches = await filter_recipes(user_id, **limits)
+    if not matches:
+        await update.message.reply_text("No favorites within those limits.")
+        return
+
+    await update.message.reply_text(
+        "🥗 Favorites within your limits — tap one to open it",
+        reply_markup=build_recipe_list_keyboard(matches),
+    )
+
+async def mealplan(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """A dinner per day from the same ingredients, generated concurrently.
+
+    Each recipe is sent as soon as it is ready; when the plan is done they
+    are saved together and offered as favorites.
+    """
+    args = list(context.args or [])
+    days = MEALPLAN_MAX_DAYS
+    if args and args[0].isdigit():
+        days = max(1, min(int(args.pop(0)), MEALPLAN_MAX_DAYS))
+    ingredients = [i.strip() for i in " ".join(args).split(",") if i.strip()]
+    if not ingredients:
+        return await update.message.reply_text(
+            f"Usage: /mealplan [days, up to {MEALPLAN_MAX_DAYS}] <ingredients, comma-separated>\n"
+            "e.g. /mealplan 5 chicken, rice, broccoli"
+        )
+
+    user_id = update.effective_user.id
+    # Rotate cuisines so the plan isn't the same dish every day; a cuisine's
+    # second turn asks for a different dish
+    cuisines = [c for c in CUISINE_CHOICES if c != "Other"]
+    reqs = [
+        RecipeRequest(
+            user_id               = user_id,
+            cuisine               = cuisines[day % len(cuisines)],
+            meal_type             = "Dinner",
+            servings              = MEALPLAN_SERVINGS,
+            time_limit            = MEALPLAN_TIME,
+            available_ingredients = ingredients,
+            variant               = day // len(cuisines),
+        )
+        for day in range(days)
+    ]
+    status = await update.message.reply_text(f"🗓️ Planning {days} dinners — each one arrives as soon as it's ready…")
+
+    async def on_queued(position: int):
+        await status.edit_text(f"⏳ Lots of cooks in the kitchen — your plan is #{position} in line.")
+
+    recipes: dict[int, str] = {}
+    try:
+        async for day, recipe in generate_meal_plan(reqs, on_queued=on_queued):
+            if not (recipe and recipe.strip()):
+                continue
+            recipes[day] = recipe
+            for chunk in split_message(f"📅 Day {day + 1} · {reqs[day].cuisine}\n\n{recipe}"):
+                await update.message.reply_text(chunk, disable_web_page_preview=True)
+    except AdmissionRejected as e:
+        await status.edit_text(e.user_message)
+        return
+    except Exception:
+        logger.exception("Meal plan failed for user %s after %d recipes", user_id, len(recipes))
+        await update.message.reply_text("❌ Something went wrong while planning. Recipes above are kept.")
+
+    if not recipes:
+        await update.message.reply_text("❌ No dinners could be planned this time. Please try /mealplan again.")
+        return
+    # One transaction for the whole plan
+    days_done = sorted(recipes)
+    # Recipes are keyed by (user, name): every day needs a distinct, non-empty name
+    names: list[str] = []
+    for d in days_done:
+        name = recipe_title(recipes[d]) or f"Day {d + 1} dinner"
+        if name in names:
+            name = f"{name} (day {d + 1})"
+        names.append(name)
+    ids = await save_recipes(user_id, [(name, recipes[d]) for name, d in zip(names, days_done)])
+
+    fav_kb = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"⭐ Day {d + 1}: {name[:40]}", callback_data=f"fav|{recipe_id}")]
+        for d, name, recipe_id in zip(days_done, names, ids)
+    ])
+    await update.message.reply_text(
+        f"✅ {len(ids)} of {days} dinners ready. Save any to favorites?", reply_markup=fav_kb
+    )
 
 COMMAND_HANDLERS = [
     CommandHandler('start', start),
@@ -106,4 +229,7 @@ COMMAND_HANDLERS = [
     CommandHandler("favorites", favorites),
     CommandHandler("clear_favorites", clear_favorites_cmd),
     CommandHandler("specific",  specific),
+    CommandHandler("search",    search),
+    CommandHandler("filter",    filter_favorites),
+    CommandHandler("mealplan",  mealplan),
 ]
@@ -10,8 +10,12 @@ from telegram.ext import (
 )
 from models.user_preferences import UserPreferences
 from models.recipe_request   import RecipeRequest
-from database.db             import set_user_preferences, set_recipe_request, save_recipe
-from services.openai_service import build_recipe_prompt, generate_recipe
+from database.async_db       import set_user_preferences, save_recipe
+from database.db             import set_recipe_request
+from services.openai_service import stream_recipe_for_request
+from services.admission      import AdmissionRejected
+from utils.helpers           import stream_to_message
+from config.default          import STREAM_EDIT_INTERVAL, PERSISTENCE_ENABLED
 
 # ─── CONVERSATION STATES ─────────────────────────────────────────────────────
 # Onboarding states
@@ -83,7 +87,7 @@ async def collect_budget(update: Update, context: ContextTypes.DEFAULT_TYPE):
         skill_level=context.user_data.get('skill', 'Intermediate'),
         budget_range=context.user_data['budget']
     )
-    set_user_preferences(user_id, prefs)
+    await set_user_preferences(user_id, prefs)
 
     await update.message.reply_text(
         "✅ Preferences saved! Use /onboard anytime to update.",
@@ -109,6 +113,7 @@ onboard_conv = ConversationHandler(
     },
     fallbacks=[CommandHandler("cancel", cancel_onboard)],
     name="onboard_conversation",
+    persistent=PERSISTENCE_ENABLED,
 )
 
 # ─── RECIPE OPTIONS ─────────────────────────────────────────────────────────
@@ -200,15 +205,29 @@ async def collect_ingredients(update: Update, context: ContextTypes.DEFAULT_TYPE
         time_limit            = context.user_data['time'],
         available_ingredients = [i.strip() for i in ingredients.split(',')]
     )
-    set_recipe_request(user_id, req)
+    set_recipe_request(user_id, req)  # buffered, returns immediately
 
-    prompt  = build_recipe_prompt(req)
-    recipe  = generate_recipe(prompt)
-    title_line = recipe.splitlines()[0].lstrip("#* ").strip() 
-    
-    # Save the recipe and get its ID
-    recipe_id = save_recipe(user_id, title_line, recipe)
-    await update.message.reply_text(recipe)
+    async def on_queued(position: int):
+        await update.message.reply_text(f"⏳ Lots of cooks in the kitchen — you're #{position} in line.")
+
+    # Stream the recipe into a placeholder so the user sees it as it's written
+    try:
+        recipe = await stream_to_message(
+            update.message,
+            stream_recipe_for_request(req, on_queued=on_queued),
+            placeholder="👩‍🍳 Cooking up your recipe…",
+            interval=STREAM_EDIT_INTERVAL,
+        )
+    except AdmissionRejected:
+        # The placeholder already explains why; let them resend ingredients later
+        return R_INGREDIENTS
+    if not recipe:
+        # The placeholder now says the generation came back empty
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    # Save the recipe under its own title and get its ID
+    recipe_id = await save_recipe(user_id, None, recipe)
 
     # Create favorite button with recipe ID
     fav_kb = InlineKeyboardMarkup([
@@ -239,4 +258,5 @@ recipe_conv = ConversationHandler(
     },
     fallbacks=[CommandHandler("cancel", cancel_recipe)],
     name="recipe_conversation",
+    persistent=PERSISTENCE_ENABLED,
 )
\ No newline at end of file
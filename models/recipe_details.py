@@ -0,0 +1,13 @@
+# models/recipe_details.py
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+@dataclass
+class RecipeDetails:
+    total_minutes: Optional[int] = None
+    kcal: Optional[float] = None
+    protein_g: Optional[float] = None
+    carbs_g: Optional[float] = None
+    fat_g: Optional[float] = None
+    budget_thb: Optional[float] = None
+    ingredients: List[str] = field(default_factory=list)
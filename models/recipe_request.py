@@ -10,3 +10,5 @@ class RecipeRequest:
     servings: int
     time_limit: int
     available_ingredients: List[str]
+    # > 0 asks for a different dish than an otherwise identical request (meal plans)
+    variant: int = 0
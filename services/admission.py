@@ -0,0 +1,189 @@
+# services/admission.py
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+from utils.cache import LRUCache
+
+class AdmissionRejected(Exception):
+    """A generation was not admitted. user_message is safe to show in chat."""
+
+    def __init__(self, user_message: str, retry_after: float | None = None):
+        super().__init__(user_message)
+        self.user_message = user_message
+        self.retry_after  = retry_after
+
+class RateLimited(AdmissionRejected):
+    """The user's own token bucket is empty."""
+
+class Overloaded(AdmissionRejected):
+    """The global wait queue is full; the request is shed."""
+
+class TokenBucket:
+    """Classic token bucket: holds up to capacity, refills at rate per second."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate     = rate
+        self.tokens   = capacity
+        self.updated  = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float = 1.0) -> float:
+        """Take amount if available and return 0, else return seconds to wait."""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.rate
+
+    def give_back(self, amount: float = 1.0):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class AdmissionController:
+    """Gatekeeper in front of upstream generation.
+
+    - per-user token buckets stop one user from hogging capacity;
+    - a global concurrency limit and tokens-per-minute budget keep us
+      inside the provider's rate limits;
+    - excess requests wait in a bounded FIFO queue, and once that is
+      full new requests are shed immediately instead of timing out.
+
+    All state is touched from the event loop only, so no locks are needed.
+    """
+
+    def __init__(self, max_concurrent: int, tokens_per_minute: int, queue_size: int,
+                 user_burst: int, user_rate_per_minute: float, max_users: int = 10000):
+        self.max_concurrent = max_concurrent
+        self.queue_size     = queue_size
+        self._tpm           = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self._user_burst    = user_burst
+        self._user_rate     = user_rate_per_minute / 60
+        self._users         = LRUCache(max_users)
+        self._active        = 0
+        self._waiters: deque[tuple[asyncio.Future, float]] = deque()
+        self._wake_handle: asyncio.TimerHandle | None = None
+        self.shed           = 0
+        self.rate_limited   = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> dict:
+        return {
+            "active":       self._active,
+            "queued":       len(self._waiters),
+            "shed":         self.shed,
+            "rate_limited": self.rate_limited,
+        }
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self._user_burst, self._user_rate)
+            self._users.put(user_id, bucket)
+        return bucket
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, cost: float,
+                    on_queued: Callable[[int], Awaitable[None]] | None = None):
+        """Hold a generation slot for the duration of the block.
+
+        Args:
+            user_id: Telegram user the generation is for
+            cost: Estimated tokens the generation will use
+            on_queued: Awaited with the 1-based queue position if we must wait
+
+        Raises:
+            RateLimited: the user has exhausted their own budget
+            Overloaded: the wait queue is full
+        """
+        # A single request larger than the whole budget would never fit
+        cost = min(cost, self._tpm.capacity)
+        bucket = self._bucket(user_id)
+        wait = bucket.try_take()
+        if wait > 0:
+            self.rate_limited += 1
+            raise RateLimited(
+                f"⏳ You're requesting recipes too quickly. Try again in {int(wait) + 1} s.",
+                retry_after=wait,
+            )
+
+        if not self._waiters and self._active < self.max_concurrent and self._tpm.try_take(cost) == 0:
+            self._active += 1
+        else:
+            if len(self._waiters) >= self.queue_size:
+                bucket.give_back()
+                self.shed += 1
+                raise Overloaded(
+                    "🔥 The kitchen is slammed right now. Please try again in a minute.",
+                    retry_after=60,
+                )
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((future, cost))
+            try:
+                # Inside the try: a failed queue notice must not leave the
+                # waiter behind to be granted a slot nobody releases
+                if on_queued is not None:
+                    await on_queued(len(self._waiters))
+                self._schedule_wake()
+                await future
+            except BaseException:
+                if not future.done() or future.cancelled():
+                    future.cancel()
+                    self._remove_waiter(future)
+                else:
+                    # Admitted just as we failed or were cancelled: hand the slot on
+                    self._release()
+                raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _remove_waiter(self, future: asyncio.Future):
+        for i, (waiter, _) in enumerate(self._waiters):
+            if waiter is future:
+                del self._waiters[i]
+                break
+
+    def _release(self):
+        self._active -= 1
+        self._wake()
+
+    def _schedule_wake(self):
+        if self._wake_handle is None:
+            self._wake()
+
+    def _wake(self):
+        """Admit queued waiters in FIFO order while capacity and budget allow."""
+        self._wake_handle = None
+        while self._waiters and self._active < self.max_concurrent:
+            future, cost = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            wait = self._tpm.try_take(cost)
+            if wait > 0:
+                # Out of token budget: retry when enough has refilled
+                loop = asyncio.get_running_loop()
+                self._wake_handle = loop.call_later(min(wait, 60.0), self._wake)
+                return
+            self._waiters.popleft()
+            self._active += 1
+            future.set_result(None)
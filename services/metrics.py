@@ -0,0 +1,168 @@
+# services/metrics.py
+"""Prometheus metrics, served as text on a local /metrics endpoint.
+
+Durations come from the utils.stages hooks: every handler, async database
+call, Bot API request and OpenAI generation lands in a fixed-bucket
+histogram. Recording one is a dict lookup, a bisect and two additions
+(well under a microsecond). Cache, queue and token counters already kept
+by the modules that own them are only read when /metrics is scraped.
+
+    curl http://127.0.0.1:9464/metrics
+"""
+import bisect
+import logging
+
+import tornado.web
+
+from database import async_db, db
+from services import openai_service
+from services.usage import usage_stats
+from utils import stages
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers a cached DB read up to a slow streamed generation
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage prefix -> (metric family, label name, help text)
+FAMILIES = {
+    "handler":  ("bot_handler_duration_seconds", "handler", "Time spent in each handler callback."),
+    "db":       ("bot_db_duration_seconds", "function", "Database calls, including time queued for a thread."),
+    "telegram": ("bot_telegram_request_duration_seconds", "method", "Bot API requests."),
+    "openai":   ("bot_openai_duration_seconds", "phase", "Chat completions: first token and whole generation."),
+}
+OTHER = ("bot_stage_duration_seconds", "stage", "Other timed stages (prompt build, admission wait, ...).")
+
+class Histogram:
+    __slots__ = ("counts", "sum", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # last slot is +Inf
+        self.sum    = 0.0
+        self.errors = 0
+
+def _record(name: str, seconds: float, ok: bool):
+    hist = _histograms.get(name)
+    if hist is None:
+        hist = _histograms[name] = Histogram()
+    hist.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+    hist.sum += seconds
+    if not ok:
+        hist.errors += 1
+
+# Stage name -> histogram
+_histograms: dict[str, Histogram] = {}
+_enabled = False
+
+def enable():
+    """Start recording stage durations (idempotent)."""
+    global _enabled
+    if not _enabled:
+        stages.add_observer(_record)
+        _enabled = True
+
+# ─── EXPOSITION ──────────────────────────────────────────────────────────────
+def _labels(pairs: dict) -> str:
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", r"\\").replace('"', r"\"") for v in pairs.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(pairs, escaped)) + "}"
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _render_histograms(out: list[str]):
+    families: dict[str, list] = {}
+    for name, hist in sorted(_histograms.items()):
+        prefix, _, rest = name.partition(".")
+        family, label, doc = FAMILIES.get(prefix, OTHER)
+        labels = {label: rest if prefix in FAMILIES else name}
+        if name in stages.handler_states:
+            conversation, state = stages.handler_states[name]
+            labels.update(conversation=conversation, state=state)
+        families.setdefault(family, [doc, []])[1].append((labels, hist))
+
+    for family, (doc, series) in families.items():
+        out.append(f"# HELP {family} {doc}")
+        out.append(f"# TYPE {family} histogram")
+        for labels, hist in series:
+            # Snapshot first; the event loop may record while we format
+            counts, total = list(hist.counts), hist.sum
+            cumulative = 0
+            for bound, n in zip((*BUCKETS, "+Inf"), counts):
+                cumulative += n
+                out.append(f"{family}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+            out.append(f"{family}_sum{_labels(labels)} {_fmt(total)}")
+            out.append(f"{family}_count{_labels(labels)} {cumulative}")
+        errors = family.removesuffix("_duration_seconds") + "_errors_total"
+        out.append(f"# HELP {errors} Timed calls that raised.")
+        out.append(f"# TYPE {errors} counter")
+        for labels, hist in series:
+            out.append(f"{errors}{_labels(labels)} {hist.errors}")
+
+def _metric(out: list[str], name: str, kind: str, doc: str, samples: list[tuple[dict, float]]):
+    out.append(f"# HELP {name} {doc}")
+    out.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        out.append(f"{name}{_labels(labels)} {_fmt(value)}")
+
+def _render_state(out: list[str]):
+    """Counters and gauges owned by other modules, read at scrape time."""
+    recipes = openai_service.recipe_cache_stats()
+    _metric(out, "bot_recipe_cache_requests_total", "counter", "Recipe cache lookups by result.", [
+        ({"result": "hit"}, recipes["hits"]),
+        ({"result": "miss"}, recipes["misses"]),
+        ({"result": "coalesced"}, recipes["coalesced"]),
+        ({"result": "pregenerated"}, recipes["pregenerated"]),
+    ])
+
+    caches = {"preferences": db.preferences_cache_stats(), "favorites": db.favorites_cache_stats()}
+    _metric(out, "bot_cache_entries", "gauge", "Entries in each in-process cache.",
+            [({"cache": c}, s["size"]) for c, s in caches.items()])
+    _metric(out, "bot_cache_requests_total", "counter", "In-process cache lookups by result.",
+            [({"cache": c, "result": r}, s[key]) for c, s in caches.items()
+             for r, key in (("hit", "hits"), ("miss", "misses"))])
+
+    admission = openai_service.admission.stats()
+    _metric(out, "bot_admission_active", "gauge", "Generations holding an admission slot.",
+            [({}, admission["active"])])
+    _metric(out, "bot_admission_queued", "gauge", "Generations waiting for admission.",
+            [({}, admission["queued"])])
+    _metric(out, "bot_admission_rejected_total", "counter", "Generations refused by admission control.", [
+        ({"reason": "shed"}, admission["shed"]),
+        ({"reason": "rate_limited"}, admission["rate_limited"]),
+    ])
+
+    _metric(out, "bot_db_pending", "gauge", "Database calls queued or running, per thread pool.",
+            [({"pool": p}, n) for p, n in async_db.pending().items()])
+    _metric(out, "bot_log_pending_rows", "gauge", "Rows waiting in each buffered log writer.",
+            [({"log": log}, n) for log, n in db.audit_log_pending().items()])
+
+    usage = usage_stats()
+    _metric(out, "bot_openai_completions_total", "counter", "Chat completions finished.",
+            [({}, usage["requests"])])
+    _metric(out, "bot_openai_tokens_total", "counter", "Tokens reported by the API.", [
+        ({"kind": "prompt"}, usage["prompt_tokens"]),
+        ({"kind": "completion"}, usage["completion_tokens"]),
+        ({"kind": "cached"}, usage["cached_tokens"]),
+    ])
+
+def render() -> str:
+    """Everything in the Prometheus text exposition format."""
+    out: list[str] = []
+    _render_histograms(out)
+    _render_state(out)
+    return "\n".join(out) + "\n"
+
+# ─── ENDPOINT ────────────────────────────────────────────────────────────────
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render())
+
+def serve(port: int, address: str = "127.0.0.1"):
+    """Serve /metrics on address:port in the running event loop."""
+    server = tornado.web.Application([("/metrics", MetricsHandler)]).listen(port, address=address)
+    logger.info("Metrics on http://%s:%d/metrics", address, port)
+    return server
@@ -1,18 +1,92 @@
 # services/openai_service.py
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable
+from config.default import (
+    OPENAI_MODEL, OPENAI_BASE_URL, OPENAI_MAX_CONCURRENCY, OPENAI_TIMEOUT,
+    RECIPE_CACHE_TTL, RECIPE_CACHE_MAX_ENTRIES, OPENAI_STREAMING,
+    ADMISSION_MAX_CONCURRENT, ADMISSION_QUEUE_SIZE, OPENAI_TPM_BUDGET,
+    ESTIMATED_TOKENS_PER_RECIPE, USER_RECIPE_BURST, USER_RECIPES_PER_MINUTE,
+    WORKERS, MEALPLAN_CONCURRENCY, PREGEN_ENABLED, PREGEN_CANDIDATE_TTL,
+)
 from models.recipe_request   import RecipeRequest
 from models.user_preferences import UserPreferences
 from database.db import get_user_preferences
+from database import async_db
+from services.admission import AdmissionController
+from services.usage import record_usage
+from utils.stages import stage, observe
+from utils.tokens import load_encoding
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
 
-if not api_key:
-    raise RuntimeError("Missing OpenAI API key; please set OPENAI_API_KEY in your .env")
-    
-client = OpenAI(api_key=api_key)
+logger = logging.getLogger(__name__)
+
+# Clients are built on first use: importing openai and setting up its HTTP
+# clients is most of the bot's cold start (see tools/startup_benchmark.py).
+_client: "OpenAI | None" = None
+_async_client: "AsyncOpenAI | None" = None
+_client_lock = threading.Lock()
+
+def _api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("Missing OpenAI API key; please set OPENAI_API_KEY in your .env")
+    return api_key
+
+def get_client() -> "OpenAI":
+    """The blocking client, created on first call."""
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(api_key=_api_key(), base_url=OPENAI_BASE_URL, timeout=OPENAI_TIMEOUT)
+        return _client
+
+def get_async_client() -> "AsyncOpenAI":
+    """The asyncio client, created on first call."""
+    global _async_client
+    if _async_client is not None:
+        return _async_client
+    with _client_lock:
+        if _async_client is None:
+            from openai import AsyncOpenAI
+            _async_client = AsyncOpenAI(api_key=_api_key(), base_url=OPENAI_BASE_URL, timeout=OPENAI_TIMEOUT)
+        return _async_client
+
+def warm_up():
+    """Create the async client and load the tokenizer on a background thread,
+    so the first recipe doesn't wait for either."""
+    def run():
+        try:
+            get_async_client()
+        except Exception:
+            logger.warning("Could not create the OpenAI client", exc_info=True)
+        load_encoding(OPENAI_MODEL)
+    threading.Thread(target=run, name="openai-warm-up", daemon=True).start()
+
+# Caps how many completions run at once; extra callers wait their turn
+# without holding up the event loop.
+_generation_slots = asyncio.Semaphore(-(-OPENAI_MAX_CONCURRENCY // WORKERS))
+
+# Per-user budgets, global TPM budget and a bounded wait queue for
+# user-initiated generations (cache hits bypass it).
+# Budgets are for the whole deployment; each worker process gets its share
+admission = AdmissionController(
+    max_concurrent       = -(-ADMISSION_MAX_CONCURRENT // WORKERS),
+    tokens_per_minute    = OPENAI_TPM_BUDGET // WORKERS,
+    queue_size           = ADMISSION_QUEUE_SIZE,
+    user_burst           = USER_RECIPE_BURST,
+    user_rate_per_minute = USER_RECIPES_PER_MINUTE,
+)
 
 COMMON_STAPLES = [
     "salt", "black pepper", "sugar", "cooking oil (neutral)",
@@ -29,47 +103,338 @@ CUISINE_BASES = {
     "Other":    []
 }
 
-def build_recipe_prompt(req: RecipeRequest) -> str:
-    """Return a rich prompt for GPT that assumes common staples + cuisine bases."""
+# Bump whenever build_recipe_prompt changes so stale cache entries stop matching.
+PROMPT_VERSION = 2
+
+# In-process cache counters, see recipe_cache_stats()
+_cache_hits   = 0
+_cache_misses = 0
+_coalesced    = 0
+_pregenerated = 0
+
+# Generations currently running, by cache key. Identical concurrent
+# requests await the leader's future instead of calling OpenAI again;
+# the result is None if the leader failed.
+_in_flight: dict[str, asyncio.Future] = {}
+
+# Everything that is the same for every request lives in the system message,
+# so it forms a stable prefix the provider can cache across requests. Keep
+# per-request values out of it.
+SYSTEM_PROMPT = (
+    "You are a professional chef & nutritionist. Create exactly ONE recipe that "
+    "matches the request in the user message.\n\n"
+
+    "### Rules\n"
+    "- Respect the meal type, servings, cuisine and maximum active time requested.\n"
+    "- Budgets are in THB for shopping in Thailand.\n"
+    "- Never use ingredients that break the listed dietary restrictions.\n"
+    f"- Assume the user ALREADY HAS these common pantry items: {', '.join(COMMON_STAPLES)}, "
+    "plus any cuisine pantry items listed in the request.\n"
+    "- Build the recipe around the ingredients the user says they have.\n"
+    "- Keep steps at the user's skill level.\n\n"
+
+    "### Output format (markdown)\n"
+    "1. Title: \n\n"
+    "2. Total time (prep + cook)\n\n"
+    "3. Ingredients  \n"
+    " - ingredients to buy\n"
+    "4. Step-by-step instructions (numbered)\n"
+    "5. Serving & plating tips\n"
+    "6. Estimated nutrition per serving (kcal, protein, carbs, fat)\n"
+    "7. Budget breakdown (approx. THB)\n"
+)
+
+def build_recipe_prompt(req: RecipeRequest, prefs: UserPreferences | None = None) -> str:
+    """Return the per-request part of the prompt; see SYSTEM_PROMPT for the rest."""
 
     # fallback in case user has no prefs stored yet
-    prefs = get_user_preferences(req.user_id) or UserPreferences(
-        dietary_restrictions=[], skill_level="Intermediate",
-        disliked_ingredients=[], budget_range="no budget"
+    prefs = prefs or get_user_preferences(req.user_id) or UserPreferences(
+        dietary_restrictions=[], skill_level="Intermediate", budget_range="no budget"
     )
 
-    pantry_assumed = COMMON_STAPLES + CUISINE_BASES.get(req.cuisine, [])
-    pantry_str     = ", ".join(pantry_assumed)
+    cuisine_bases = ", ".join(CUISINE_BASES.get(req.cuisine, [])) or "none"
 
     prompt = (
-        f"### Task\n"
-        f"You are a professional chef & nutritionist.  Create ONE {req.meal_type.lower()} recipe "
-        f"for {req.servings} servings.  It must take no more than {req.time_limit} minutes "
-        f"of active time and should belong to **{req.cuisine} cuisine**.\n\n"
-
-        f"### Constraints\n"
-        f"- Budget: around {prefs.budget_range} THB in Thailand.\n"
-        f"- Dietary restrictions: {', '.join(prefs.dietary_restrictions) or 'none'}.\n"
-        f"- Assume the user ALREADY HAS these common pantry items: {pantry_str}.\n"
-        f"- They ALSO have: {', '.join(req.available_ingredients) or 'no extra ingredients listed'}.\n"
-        f"- Skill level: {prefs.skill_level}; keep steps at that difficulty.\n\n"
-
-        f"### Output format (markdown)\n"
-        f"1. Title: \n\n"
-        f"2. Total time (prep + cook)\n\n"
-        f"3. Ingredients  \n"
-        f" - ingredients to buy\n"
-        f"4. Step-by-step instructions (numbered)\n"
-        f"5. Serving & plating tips\n"
-        f"6. Estimated nutrition per serving (kcal, protein, carbs, fat)\n"
-        f"7. Budget breakdown (approx. THB)\n"
+        f"### Request\n"
+        f"- Meal: {req.meal_type.lower()} for {req.servings} servings\n"
+        f"- Cuisine: {req.cuisine}\n"
+        f"- Max active time: {req.time_limit} minutes\n"
+        f"- Budget: around {prefs.budget_range} THB\n"
+        f"- Dietary restrictions: {', '.join(prefs.dietary_restrictions) or 'none'}\n"
+        f"- Skill level: {prefs.skill_level}\n"
+        f"- Cuisine pantry items they also have: {cuisine_bases}\n"
+        f"- Ingredients they have: {', '.join(req.available_ingredients) or 'no extra ingredients listed'}\n"
     )
+    if req.variant:
+        prompt += f"- Variation #{req.variant + 1}: suggest a different dish than your first choice\n"
     return prompt
 
 
+def build_messages(prompt: str) -> list[dict]:
+    """Chat messages for a request prompt: shared system prefix first."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user",   "content": prompt},
+    ]
+
+
 def generate_recipe(prompt: str) -> str:
-    resp = client.chat.completions.create(
-      model="gpt-4",
-      messages=[{"role": "user", "content": prompt}]
+    resp = get_client().chat.completions.create(
+      model=OPENAI_MODEL,
+      messages=build_messages(prompt)
     )
     return resp.choices[0].message.content
+
+
+async def generate_recipe_async(prompt: str, user_id: int | None = None,
+                                purpose: str | None = None) -> str:
+    """Non-blocking variant of generate_recipe for use inside handlers.
+
+    Returns "" when the completion has no content. purpose is recorded in
+    llm_usage (see services.usage.record_usage).
+    """
+    messages = build_messages(prompt)
+    async with _generation_slots:
+        started = time.perf_counter()
+        resp = await get_async_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages
+        )
+    finished = time.perf_counter()
+    observe("openai.generate", finished - started)
+    await record_usage(
+        model=OPENAI_MODEL, user_id=user_id, messages=messages, usage=resp.usage,
+        started=started, first_token_at=None, finished=finished, purpose=purpose,
+    )
+    # content is None when the model returned nothing (e.g. a refusal)
+    return resp.choices[0].message.content or ""
+
+
+async def stream_recipe(prompt: str, user_id: int | None = None) -> AsyncIterator[str]:
+    """Yield the completion for prompt piece by piece as tokens arrive."""
+    messages = build_messages(prompt)
+    async with _generation_slots:
+        started = time.perf_counter()
+        first_token_at = None
+        usage = None
+        stream = await get_async_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            # The final chunk carries usage and no choices
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    # Reported on arrival so traces place the span correctly
+                    observe("openai.first_token", first_token_at - started)
+                yield chunk.choices[0].delta.content
+    finished = time.perf_counter()
+    # Timed by hand: the consumer's work between pieces shouldn't count
+    observe("openai.generate", finished - started)
+    await record_usage(
+        model=OPENAI_MODEL, user_id=user_id, messages=messages, usage=usage,
+        started=started, first_token_at=first_token_at, finished=finished,
+    )
+
+
+def normalize_ingredients(ingredients: list[str]) -> list[str]:
+    """Lowercase, deduplicate and sort an ingredient list."""
+    return sorted({i.strip().lower() for i in ingredients if i and i.strip()})
+
+
+def recipe_cache_key(req: RecipeRequest, prefs: UserPreferences) -> str:
+    """Canonical hash of everything that shapes the generated recipe.
+
+    The user id is deliberately left out so identical requests from
+    different users share one entry.
+    """
+    payload = {
+        "v":           PROMPT_VERSION,
+        "model":       OPENAI_MODEL,
+        "cuisine":     req.cuisine.strip().lower(),
+        "meal":        req.meal_type.strip().lower(),
+        "servings":    int(req.servings),
+        "time_limit":  int(req.time_limit),
+        "ingredients": normalize_ingredients(req.available_ingredients),
+        "dietary":     sorted({d.strip().lower() for d in prefs.dietary_restrictions}),
+        "skill":       prefs.skill_level.strip().lower(),
+        "budget":      prefs.budget_range.strip().lower(),
+    }
+    # Only present when set, so existing entries keep their keys
+    if req.variant:
+        payload["variant"] = req.variant
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def candidate_profile(prefs: UserPreferences) -> str:
+    """Fingerprint of what shapes a pre-generated recipe besides the request itself."""
+    payload = {
+        "v":       PROMPT_VERSION,
+        "model":   OPENAI_MODEL,
+        "dietary": sorted({d.strip().lower() for d in prefs.dietary_restrictions}),
+        "skill":   prefs.skill_level.strip().lower(),
+        "budget":  prefs.budget_range.strip().lower(),
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def recipe_cache_stats() -> dict:
+    """Hit/miss counters for the recipe cache since process start."""
+    total = _cache_hits + _cache_misses
+    return {
+        "hits":         _cache_hits,
+        "misses":       _cache_misses,
+        "hit_rate":     _cache_hits / total if total else 0.0,
+        "coalesced":    _coalesced,
+        "pregenerated": _pregenerated,
+    }
+
+
+async def stream_recipe_for_request(
+    req: RecipeRequest,
+    on_queued: Callable[[int], Awaitable[None]] | None = None,
+) -> AsyncIterator[str]:
+    """Yield the recipe for req in pieces, served from the cache when possible.
+
+    A cache hit arrives as a single piece, as does a recipe pre-generated
+    for this user and a request identical to one already being generated:
+    it waits for that generation instead of starting another. Otherwise the request goes through admission control
+    (on_queued is awaited with the queue position if it has to wait), then
+    the completion is streamed (or fetched whole when OPENAI_STREAMING is
+    off) and cached once it has finished.
+
+    Raises:
+        AdmissionRejected: the user is rate limited or the queue is full
+    """
+    global _cache_hits, _cache_misses, _coalesced, _pregenerated
+
+    prefs = await async_db.get_user_preferences(req.user_id)
+    key   = recipe_cache_key(req, prefs)
+
+    cached = await async_db.get_cached_recipe(key, RECIPE_CACHE_TTL)
+    if cached is not None:
+        _cache_hits += 1
+        yield cached
+        return
+    _cache_misses += 1
+
+    # Written ahead of time for this user (see services/pregeneration.py)
+    if PREGEN_ENABLED:
+        candidate = await async_db.take_recipe_candidate(
+            req, normalize_ingredients(req.available_ingredients),
+            candidate_profile(prefs), PREGEN_CANDIDATE_TTL,
+        )
+        if candidate is not None:
+            _pregenerated += 1
+            yield candidate
+            return
+
+    # Single flight: piggyback on an identical generation already running.
+    # If it fails (e.g. its user was rate limited) we generate our own.
+    flight = _in_flight.get(key)
+    if flight is not None:
+        recipe = await asyncio.shield(flight)
+        if recipe is not None:
+            _coalesced += 1
+            yield recipe
+            return
+
+    flight = asyncio.get_running_loop().create_future()
+    _in_flight[key] = flight
+    recipe = None
+    try:
+        with stage("prompt.build"):
+            prompt = build_recipe_prompt(req, prefs)
+        waiting = time.perf_counter()
+        async with admission.admit(req.user_id, ESTIMATED_TOKENS_PER_RECIPE, on_queued):
+            observe("admission.wait", time.perf_counter() - waiting)
+            if OPENAI_STREAMING:
+                parts = []
+                async for piece in stream_recipe(prompt, req.user_id):
+                    parts.append(piece)
+                    yield piece
+                recipe = "".join(parts)
+            else:
+                recipe = await generate_recipe_async(prompt, req.user_id)
+                yield recipe
+    finally:
+        if _in_flight.get(key) is flight:
+            del _in_flight[key]
+        flight.set_result(recipe if recipe and recipe.strip() else None)
+
+    if recipe and recipe.strip():
+        await async_db.put_cached_recipe(key, recipe, RECIPE_CACHE_TTL, RECIPE_CACHE_MAX_ENTRIES)
+
+
+async def generate_meal_plan(
+    reqs: list[RecipeRequest],
+    on_queued: Callable[[int], Awaitable[None]] | None = None,
+) -> AsyncIterator[tuple[int, str]]:
+    """Yield (index, recipe) for each request as soon as that recipe is ready.
+
+    Cached recipes are returned straight away, before admission. The rest
+    are admitted once, charged for each of them, so a week of dinners
+    doesn't spend the user's burst seven times. They are generated
+    concurrently, at most MEALPLAN_CONCURRENCY at a time (and within the
+    global completion cap), so the plan takes about as long as its slowest
+    recipe. A day whose generation fails is logged and yielded as "".
+
+    Raises:
+        AdmissionRejected: the user is rate limited or the queue is full
+    """
+    global _cache_hits, _cache_misses
+    if not reqs:
+        return
+    user_id = reqs[0].user_id
+    prefs   = await async_db.get_user_preferences(user_id)
+    slots   = asyncio.Semaphore(MEALPLAN_CONCURRENCY)
+    keys    = [recipe_cache_key(req, prefs) for req in reqs]
+
+    # Cached days need no admission and cost nothing
+    cached = await asyncio.gather(*(async_db.get_cached_recipe(key, RECIPE_CACHE_TTL) for key in keys))
+    misses = [i for i, recipe in enumerate(cached) if recipe is None]
+    _cache_hits   += len(reqs) - len(misses)
+    _cache_misses += len(misses)
+    for i, recipe in enumerate(cached):
+        if recipe is not None:
+            yield i, recipe
+    if not misses:
+        return
+
+    async def one(index: int) -> tuple[int, str]:
+        # One failed day must not cancel the others
+        try:
+            async with slots:
+                with stage("prompt.build"):
+                    prompt = build_recipe_prompt(reqs[index], prefs)
+                recipe = await generate_recipe_async(prompt, user_id)
+        except Exception:
+            logger.exception("Meal plan day %d failed for user %s", index + 1, user_id)
+            return index, ""
+        if recipe.strip():
+            await async_db.put_cached_recipe(keys[index], recipe, RECIPE_CACHE_TTL, RECIPE_CACHE_MAX_ENTRIES)
+        return index, recipe
+
+    waiting = time.perf_counter()
+    async with admission.admit(user_id, ESTIMATED_TOKENS_PER_RECIPE * len(misses), on_queued):
+        observe("admission.wait", time.perf_counter() - waiting)
+        tasks = [asyncio.ensure_future(one(i)) for i in misses]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The consumer stopped early
+            for task in tasks:
+                task.cancel()
+
+
+async def get_recipe_for_request(req: RecipeRequest) -> str:
+    """Return the full recipe for req, served from the cache when possible."""
+    return "".join([piece async for piece in stream_recipe_for_request(req)])
@@ -0,0 +1,129 @@
+# services/pregeneration.py
+"""Recipes generated ahead of time for returning users.
+
+A JobQueue job runs every PREGEN_INTERVAL seconds. For each active user it
+predicts the next /recipe from their recipe_requests history and stores
+the generated recipe in recipe_candidates. A later request with the same
+cuisine, meal, servings and time, listing at least the predicted
+ingredients, is then answered from the pool straight away (see
+stream_recipe_for_request).
+
+Prediction: the most frequent request shape among the latest requests
+(ties go to the most recent), and the ingredients that appear in at least
+half of the requests with that shape.
+
+Runs only while the bot is idle: nothing admitted or queued in this
+process, and no recipe request or user-facing completion from any worker
+in the last PREGEN_IDLE_SECONDS (read from SQLite, since only one worker
+runs the job). Stops once PREGEN_DAILY_TOKENS have been spent in the last
+24 hours (counted from llm_usage rows tagged "pregen").
+"""
+import logging
+import time
+from collections import Counter
+
+from config.default import (
+    PREGEN_ENABLED, PREGEN_INTERVAL, PREGEN_DAILY_TOKENS, PREGEN_USERS_PER_RUN,
+    PREGEN_ACTIVE_DAYS, PREGEN_MIN_REQUESTS, PREGEN_CANDIDATE_TTL, PREGEN_IDLE_SECONDS,
+    ESTIMATED_TOKENS_PER_RECIPE,
+)
+from database import async_db, db
+from models.recipe_request import RecipeRequest
+from services.openai_service import (
+    admission, build_recipe_prompt, candidate_profile, generate_recipe_async,
+    normalize_ingredients,
+)
+
+logger = logging.getLogger(__name__)
+
+PURPOSE = "pregen"      # llm_usage.purpose for budget accounting
+HISTORY = 20            # latest requests considered per user
+
+def predict_next_request(user_id: int, history: list[tuple]) -> RecipeRequest | None:
+    """Most likely next request from (cuisine, meal, servings, time_limit, ingredients) rows, newest first."""
+    if not history:
+        return None
+    shapes = Counter(tuple(row[:4]) for row in history)
+    newest = {}
+    for i, row in enumerate(history):
+        newest.setdefault(tuple(row[:4]), i)
+    shape = max(shapes, key=lambda s: (shapes[s], -newest[s]))
+
+    rows = [row for row in history if tuple(row[:4]) == shape]
+    seen = Counter(i for row in rows for i in normalize_ingredients((row[4] or "").split(",")))
+    staples = sorted(i for i, n in seen.items() if n * 2 >= len(rows))
+    if not staples:
+        return None
+
+    cuisine, meal, servings, time_limit = shape
+    return RecipeRequest(
+        user_id               = user_id,
+        cuisine               = cuisine,
+        meal_type             = meal,
+        servings              = servings,
+        time_limit            = time_limit,
+        available_ingredients = staples,
+    )
+
+async def _busy() -> bool:
+    """Users are (or just were) generating; background work must not compete."""
+    if admission.active > 0 or admission.queued > 0:
+        return True
+    # Other workers' admission controllers aren't visible from here
+    last = await async_db.run_read(db.last_user_generation)
+    return last is not None and time.time() - last < PREGEN_IDLE_SECONDS
+
+async def pregenerate(context=None) -> int:
+    """One pass over active users; returns how many candidates were stored."""
+    if await _busy():
+        logger.debug("Skipping pre-generation: users are generating")
+        return 0
+    now = time.time()
+    spent = await async_db.run_read(db.llm_tokens_since, now - 24 * 3600, PURPOSE)
+    users = await async_db.run_read(
+        db.pregeneration_users,
+        now - PREGEN_ACTIVE_DAYS * 24 * 3600, PREGEN_MIN_REQUESTS,
+        now - PREGEN_CANDIDATE_TTL, PREGEN_USERS_PER_RUN,
+    )
+
+    stored = 0
+    for user_id in users:
+        if spent + ESTIMATED_TOKENS_PER_RECIPE > PREGEN_DAILY_TOKENS:
+            logger.info("Pre-generation budget reached (%d of %d tokens today)", spent, PREGEN_DAILY_TOKENS)
+            break
+        if await _busy():
+            break
+        history = await async_db.run_read(db.recent_recipe_requests, user_id, HISTORY)
+        req = predict_next_request(user_id, history)
+        if req is None:
+            continue
+
+        prefs = await async_db.get_user_preferences(user_id)
+        try:
+            recipe = await generate_recipe_async(build_recipe_prompt(req, prefs), user_id, purpose=PURPOSE)
+        except Exception:
+            logger.exception("Pre-generation failed for user %s", user_id)
+            break
+        # Until its llm_usage row lands, count the estimate
+        spent += ESTIMATED_TOKENS_PER_RECIPE
+        if recipe and recipe.strip():
+            await async_db.run_write(
+                db.put_recipe_candidate, user_id, req,
+                ",".join(req.available_ingredients), candidate_profile(prefs), recipe,
+            )
+            stored += 1
+
+    if stored:
+        logger.info("Pre-generated %d recipes", stored)
+    return stored
+
+def schedule(application):
+    """Add the repeating job to application.job_queue when PREGEN_ENABLED."""
+    if not PREGEN_ENABLED:
+        return
+    if application.job_queue is None:
+        logger.warning("PREGEN_ENABLED needs python-telegram-bot[job-queue]; pre-generation is off")
+        return
+    application.job_queue.run_repeating(
+        pregenerate, interval=PREGEN_INTERVAL, first=PREGEN_INTERVAL, name="pregenerate",
+    )
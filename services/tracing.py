@@ -0,0 +1,192 @@
+# services/tracing.py
+"""Sampled per-update traces, written as JSON lines.
+
+A sampled update gets a root span covering Application.process_update and
+a child span for every utils.stages block it runs through: handlers, DB
+calls, prompt build, admission, OpenAI and Bot API requests. Updates that
+are not sampled pay for one random() call and one contextvar lookup per
+stage. With TRACE_SLOW_MS set, every update is recorded and kept if it was
+sampled or ran slower than the threshold.
+
+`kill -USR1 <pid>` (or profile_next()) runs the next update under cProfile.
+The stats are saved next to TRACE_FILE and the trace points at them.
+cProfile sees the whole event loop thread, so other updates running at the
+same time show up in the profile too.
+
+    python -m services.tracing folded traces.jsonl > traces.folded
+    flamegraph.pl traces.folded > traces.svg
+"""
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import Sequence
+
+from telegram import Update
+from telegram.ext import Application
+
+from config.default import TRACE_SAMPLE_RATE, TRACE_SLOW_MS, TRACE_FILE
+from database.audit_log import AuditLogWriter
+from utils import stages
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    __slots__ = ("trace_id", "started", "wall", "spans", "sampled")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = uuid.uuid4().hex
+        self.started  = time.perf_counter()
+        self.wall     = time.time()
+        self.spans: list[tuple[str, float, float, bool]] = []   # name, start, seconds, ok
+        self.sampled  = sampled
+
+_current: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("trace", default=None)
+_profile_pending = 0
+_profiling = False
+_enabled = False
+
+def _on_stage(name: str, seconds: float, ok: bool):
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append((name, time.perf_counter() - seconds - trace.started, seconds, ok))
+
+def _write_lines(rows: Sequence[tuple]):
+    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+        f.writelines(line + "\n" for (line,) in rows)
+
+# Lines are appended off the event loop, like the audit log rows
+_trace_log = AuditLogWriter(_write_lines, batch_size=200, flush_interval=1.0, name="trace-writer")
+
+def enable():
+    """Attach to the stage hooks and arm SIGUSR1 for on-demand profiling (idempotent)."""
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    stages.add_observer(_on_stage)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *_: profile_next())
+
+def profile_next(count: int = 1):
+    """Run the next `count` updates under cProfile (traced regardless of sampling)."""
+    global _profile_pending
+    _profile_pending += count
+
+def close():
+    """Write traces still buffered."""
+    _trace_log.close()
+
+def _describe(update: Update) -> dict:
+    """What the update was, without message text."""
+    info = {"update_id": update.update_id}
+    if update.effective_user:
+        info["user_id"] = update.effective_user.id
+    if update.callback_query:
+        info["kind"] = "callback:" + (update.callback_query.data or "").split("|", 1)[0]
+    elif update.effective_message and (update.effective_message.text or "").startswith("/"):
+        info["kind"] = update.effective_message.text.split(maxsplit=1)[0].split("@", 1)[0]
+    elif update.effective_message:
+        info["kind"] = "message"
+    else:
+        info["kind"] = "other"
+    return info
+
+def _finish(trace: Trace, update: Update, seconds: float, ok: bool, profile: str | None):
+    if not trace.sampled and seconds * 1000 < TRACE_SLOW_MS and profile is None:
+        return
+    record = {
+        "trace_id": trace.trace_id,
+        **_describe(update),
+        "start": trace.wall,
+        "duration_ms": round(seconds * 1000, 3),
+        "ok": ok,
+        "spans": [
+            {"name": name, "start_ms": round(start * 1000, 3),
+             "duration_ms": round(dur * 1000, 3), "ok": span_ok}
+            for name, start, dur, span_ok in trace.spans
+        ],
+    }
+    if profile:
+        record["profile"] = profile
+    _trace_log.append((json.dumps(record, separators=(",", ":")),))
+
+class TracingApplication(Application):
+    """Application whose process_update opens a root span for sampled updates."""
+
+    async def process_update(self, update: object) -> None:
+        global _profile_pending, _profiling
+        profiler = None
+        if _profile_pending and not _profiling:
+            _profile_pending -= 1
+            _profiling = True
+            profiler = cProfile.Profile()
+        sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+        if not (sampled or TRACE_SLOW_MS > 0 or profiler) or not isinstance(update, Update):
+            return await super().process_update(update)
+
+        trace = Trace(sampled)
+        token = _current.set(trace)
+        ok = False
+        if profiler:
+            profiler.enable()
+        try:
+            await super().process_update(update)
+            ok = True
+        finally:
+            seconds = time.perf_counter() - trace.started
+            _current.reset(token)
+            path = None
+            if profiler:
+                profiler.disable()
+                _profiling = False
+                path = f"{os.path.splitext(TRACE_FILE)[0]}-{update.update_id}.prof"
+                profiler.dump_stats(path)
+                logger.info("Profiled update %d to %s", update.update_id, path)
+            _finish(trace, update, seconds, ok, path)
+
+# ─── OFFLINE AGGREGATION ─────────────────────────────────────────────────────
+def fold(records) -> Counter:
+    """Folded stacks ("update;/recipe;handler.x;db.y" -> self-time in us).
+
+    Child spans are nested by time containment, so a Bot API edit sent
+    while a completion streams sits under openai.generate.
+    """
+    stacks: Counter = Counter()
+    for rec in records:
+        root = ("update", rec["kind"])
+        spans = sorted(rec["spans"], key=lambda s: (s["start_ms"], -s["duration_ms"]))
+        # Spans still open at this point: (end_ms, stack path)
+        open_: list[tuple[float, tuple]] = []
+        self_time = {root: rec["duration_ms"]}
+        for span in spans:
+            end = span["start_ms"] + span["duration_ms"]
+            while open_ and open_[-1][0] < end - 1e-6:
+                open_.pop()
+            parent = open_[-1][1] if open_ else root
+            path = (*parent, span["name"])
+            self_time[parent] = self_time.get(parent, 0.0) - span["duration_ms"]
+            self_time[path] = self_time.get(path, 0.0) + span["duration_ms"]
+            open_.append((end, path))
+        for path, ms in self_time.items():
+            stacks[";".join(path)] += max(0, round(ms * 1000))
+    return stacks
+
+def _main(argv: list[str]):
+    if len(argv) != 2 or argv[0] != "folded":
+        sys.exit("usage: python -m services.tracing folded traces.jsonl")
+    with open(argv[1], encoding="utf-8") as f:
+        stacks = fold(json.loads(line) for line in f if line.strip())
+    for stack, micros in sorted(stacks.items()):
+        if micros:
+            print(stack, micros)
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
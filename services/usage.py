@@ -0,0 +1,107 @@
+# services/usage.py
+"""Token accounting for chat completions.
+
+Each completion is counted locally with the tokenizer before it is sent and
+again from the usage the API reports, then queued to the llm_usage table.
+
+    python -m services.usage [hours]
+
+prints a report over the last N hours (default 24).
+"""
+import asyncio
+import sys
+import time
+
+from database.db import record_llm_usage, llm_usage_summary
+from utils.tokens import count_message_tokens
+
+# In-process totals since start, see usage_stats()
+_totals = {
+    "requests":          0,
+    "prompt_tokens_est": 0,
+    "prompt_tokens":     0,
+    "completion_tokens": 0,
+    "cached_tokens":     0,
+    "prefix_tokens_est": 0,
+}
+
+def _estimate(messages: list[dict], model: str) -> tuple[int, int]:
+    """(whole prompt, shared prefix) token estimates."""
+    # Everything before the last message is the shared prefix
+    return count_message_tokens(messages, model), count_message_tokens(messages[:-1], model)
+
+async def record_usage(
+    model: str,
+    user_id: int | None,
+    messages: list[dict],
+    usage,
+    started: float,
+    first_token_at: float | None,
+    finished: float,
+    purpose: str | None = None,
+):
+    """Account one completion. usage is the API's usage object, or None if absent.
+
+    purpose tags background work (e.g. "pregen") so it can be budgeted apart.
+    Tokens are counted on a thread: encoding a long prompt, or loading the
+    tokenizer if warm-up hasn't yet, must not hold up the event loop.
+    """
+    estimated, prefix = await asyncio.to_thread(_estimate, messages, model)
+
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None)
+
+    _totals["requests"]          += 1
+    _totals["prompt_tokens_est"] += estimated
+    _totals["prompt_tokens"]     += prompt_tokens or 0
+    _totals["completion_tokens"] += completion_tokens or 0
+    _totals["cached_tokens"]     += cached_tokens or 0
+    _totals["prefix_tokens_est"] += prefix
+
+    record_llm_usage((
+        user_id,
+        model,
+        estimated,
+        prompt_tokens,
+        completion_tokens,
+        cached_tokens,
+        (first_token_at - started) * 1000 if first_token_at else None,
+        (finished - started) * 1000,
+        time.time(),
+        purpose,
+    ))
+
+def usage_stats() -> dict:
+    """Token totals since process start, with prefix and cache ratios."""
+    stats = dict(_totals)
+    stats["prefix_ratio_est"] = (
+        stats["prefix_tokens_est"] / stats["prompt_tokens_est"] if stats["prompt_tokens_est"] else 0.0
+    )
+    stats["cached_ratio"] = (
+        stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    )
+    return stats
+
+def format_usage_report(hours: float = 24) -> str:
+    """Human-readable token report for the last N hours, from llm_usage."""
+    s = llm_usage_summary(time.time() - hours * 3600)
+    if not s["requests"]:
+        return f"No completions in the last {hours:g}h."
+    cached_ratio = s["cached_tokens"] / s["prompt_tokens"] if s["prompt_tokens"] else 0.0
+    lines = [
+        f"Completions (last {hours:g}h): {s['requests']}",
+        f"Prompt tokens:     {s['prompt_tokens']} reported, {s['prompt_tokens_est']} estimated",
+        f"Completion tokens: {s['completion_tokens']}",
+        f"Cached prefix:     {s['cached_tokens']} tokens ({cached_ratio:.1%} of prompt)",
+        f"Avg per request:   {s['prompt_tokens'] / s['requests']:.0f} prompt, "
+        f"{s['completion_tokens'] / s['requests']:.0f} completion",
+    ]
+    if s["avg_ttft_ms"] is not None:
+        lines.append(f"Avg first token:   {s['avg_ttft_ms']:.0f} ms")
+    lines.append(f"Avg latency:       {s['avg_latency_ms']:.0f} ms")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    print(format_usage_report(float(sys.argv[1]) if len(sys.argv) > 1 else 24))
@@ -0,0 +1,269 @@
+# supervisor.py
+"""Run the bot as N worker processes behind a single update router.
+
+The supervisor is the only process talking to Telegram for updates (long
+polling or webhook, per BOT_MODE). It routes each update to a worker by
+consistent hashing on the effective user id, so one user's updates reach
+the same process, in order, next to their user_data and conversation
+state. Workers are ordinary Applications without an Updater, built by
+build_application, whose PerChatUpdateProcessor (utils/update_processor.py)
+then runs each chat's updates one after another. They receive batches of
+update JSON on 127.0.0.1 and reply to Telegram directly. A worker that dies
+is restarted with exponential backoff.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import signal
+import time
+
+import httpx
+import tornado.web
+from telegram import Bot, Update
+
+from config.default import (
+    METRICS_ENABLED, BOT_MODE, TELEGRAM_API_URL, WORKER_RESTART_MAX_DELAY,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+)
+from utils.hashring import HashRing
+from utils.log import configure_logging
+
+logger = logging.getLogger(__name__)
+
+UPDATES_PATH  = "/updates"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+FORWARD_BATCH = 100          # updates per POST to a worker
+FORWARD_GIVE_UP = 60         # seconds a batch may wait for a dead worker
+STABLE_AFTER = 60            # seconds up before a worker's backoff resets
+
+def effective_user_id(data: dict) -> int | None:
+    """Update.effective_user.id (or the chat id) read from raw update JSON."""
+    for field, value in data.items():
+        if field == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+        chat = value.get("chat") or value.get("message", {}).get("chat")
+        if chat:
+            return chat["id"]
+    return None
+
+# ─── WORKER ──────────────────────────────────────────────────────────────────
+class _UpdatesHandler(tornado.web.RequestHandler):
+    def initialize(self, bot_app):
+        self.bot_app = bot_app
+
+    async def post(self):
+        for data in json.loads(self.request.body):
+            await self.bot_app.update_queue.put(Update.de_json(data, self.bot_app.bot))
+        self.set_status(204)
+
+class _HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("ok")
+
+async def _serve_worker(build_application, token: str, index: int, port: int):
+    application = build_application(token, updater=False)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    if index == 0:
+        # One process is enough; candidates are shared through SQLite
+        from services import pregeneration
+        pregeneration.schedule(application)
+    await application.start()
+    routes = [
+        (UPDATES_PATH, _UpdatesHandler, {"bot_app": application}),
+        ("/health", _HealthHandler),
+    ]
+    if METRICS_ENABLED:
+        # Imported here: the supervisor process never loads the services
+        from services.metrics import MetricsHandler
+        routes.append(("/metrics", MetricsHandler))
+    server = tornado.web.Application(routes).listen(port, address="127.0.0.1")
+    logger.info("Worker %d serving on 127.0.0.1:%d", index, port)
+
+    await stopping.wait()
+    server.stop()
+    await application.stop()
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+def run_worker(build_application, token: str, index: int, port: int):
+    """Process entry point: one Application serving forwarded updates."""
+    configure_logging()
+    asyncio.run(_serve_worker(build_application, token, index, port))
+
+# ─── SUPERVISOR ──────────────────────────────────────────────────────────────
+class Supervisor:
+    def __init__(self, build_application, token: str, workers: int, base_port: int):
+        self.build_application = build_application
+        self.token   = token
+        self.ring    = HashRing(workers)
+        self.ports   = [base_port + i for i in range(workers)]
+        self.procs: list[multiprocessing.Process | None] = [None] * workers
+        self.started = [0.0] * workers
+        self.failures = [0] * workers
+        self.queues: list[asyncio.Queue] = []
+        self.stopping = asyncio.Event()
+        self._ctx = multiprocessing.get_context("spawn")
+
+    # ─── processes ───────────────────────────────────────────────────────────
+    def _spawn(self, i: int):
+        proc = self._ctx.Process(
+            target=run_worker,
+            args=(self.build_application, self.token, i, self.ports[i]),
+            name=f"worker-{i}",
+        )
+        proc.start()
+        self.procs[i], self.started[i] = proc, time.monotonic()
+
+    async def _monitor(self):
+        """Restart dead workers, backing off when one keeps crashing."""
+        died_at: dict[int, float] = {}
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            for i, proc in enumerate(self.procs):
+                if proc.is_alive():
+                    if now - self.started[i] > STABLE_AFTER:
+                        self.failures[i] = 0
+                    continue
+                if i not in died_at:
+                    died_at[i] = now
+                    logger.warning("Worker %d exited with code %s", i, proc.exitcode)
+                delay = min(2 ** self.failures[i], WORKER_RESTART_MAX_DELAY)
+                if now - died_at[i] >= delay:
+                    self.failures[i] += 1
+                    del died_at[i]
+                    logger.info("Restarting worker %d", i)
+                    self._spawn(i)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    def _stop_workers(self, timeout: float = 15):
+        for proc in self.procs:
+            if proc and proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + timeout
+        for proc in self.procs:
+            if proc:
+                proc.join(max(0.0, deadline - time.monotonic()))
+                if proc.is_alive():
+                    proc.kill()
+
+    # ─── routing ─────────────────────────────────────────────────────────────
+    def route(self, data: dict):
+        """Queue one update for the worker that owns its user."""
+        key = effective_user_id(data)
+        worker = self.ring.node_for(key if key is not None else data["update_id"])
+        self.queues[worker].put_nowait(data)
+
+    async def _forward(self, i: int, client: httpx.AsyncClient):
+        """Send queued updates to worker i in order, batching whatever has piled up."""
+        url = f"http://127.0.0.1:{self.ports[i]}{UPDATES_PATH}"
+        queue = self.queues[i]
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < FORWARD_BATCH and not queue.empty():
+                batch.append(queue.get_nowait())
+            first_try = time.monotonic()
+            while True:
+                try:
+                    resp = await client.post(url, json=batch)
+                    resp.raise_for_status()
+                    break
+                except httpx.HTTPError as e:
+                    # The worker is starting or restarting; keep the order and wait
+                    if time.monotonic() - first_try > FORWARD_GIVE_UP:
+                        logger.error("Dropping %d updates for worker %d: %s", len(batch), i, e)
+                        break
+                    await asyncio.sleep(0.25)
+
+    # ─── ingress ─────────────────────────────────────────────────────────────
+    async def _poll(self, bot: Bot):
+        await bot.delete_webhook()
+        offset = None
+        while not self.stopping.is_set():
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=10, allowed_updates=Update.ALL_TYPES
+                )
+            except Exception:
+                logger.exception("Error fetching updates")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                self.route(update.to_dict())
+                offset = update.update_id + 1
+
+    async def _serve_webhook(self, bot: Bot):
+        if not WEBHOOK_SECRET:
+            raise RuntimeError("Missing WEBHOOK_SECRET in .env (required for BOT_MODE=webhook)")
+        supervisor = self
+
+        class WebhookHandler(tornado.web.RequestHandler):
+            def post(self):
+                secret = self.request.headers.get(SECRET_HEADER, "")
+                if not hmac.compare_digest(secret, WEBHOOK_SECRET):
+                    raise tornado.web.HTTPError(403)
+                try:
+                    data = json.loads(self.request.body)
+                except ValueError:
+                    raise tornado.web.HTTPError(400)
+                supervisor.route(data)
+
+        server = tornado.web.Application([(f"/{WEBHOOK_PATH}", WebhookHandler)]).listen(
+            WEBHOOK_PORT, address=WEBHOOK_LISTEN
+        )
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        logger.info("Routing webhook on %s:%d/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        await self.stopping.wait()
+        server.stop()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        self.queues = [asyncio.Queue() for _ in self.ports]
+        for i in range(len(self.ports)):
+            self._spawn(i)
+        logger.info("Started %d workers", len(self.ports))
+
+        bot = Bot(self.token, base_url=f"{TELEGRAM_API_URL}/bot", base_file_url=f"{TELEGRAM_API_URL}/file/bot")
+        async with bot, httpx.AsyncClient(timeout=10) as client:
+            tasks = [asyncio.create_task(self._forward(i, client)) for i in range(len(self.ports))]
+            tasks.append(asyncio.create_task(self._monitor()))
+            ingress = self._serve_webhook(bot) if BOT_MODE == "webhook" else self._poll(bot)
+            ingress_task = asyncio.create_task(ingress)
+            await self.stopping.wait()
+            ingress_task.cancel()
+
+            # Hand over what has already been received before stopping workers
+            deadline = time.monotonic() + 5
+            while any(not q.empty() for q in self.queues) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(ingress_task, *tasks, return_exceptions=True)
+
+        logger.info("Stopping workers...")
+        self._stop_workers()
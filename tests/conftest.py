@@ -0,0 +1,8 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# Never touch database/bot.db; config.default reads these at import
+os.environ["DB_FILE"] = os.path.join(tempfile.mkdtemp(prefix="recipe-tests-"), "test.db")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
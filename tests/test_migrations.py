@@ -0,0 +1,62 @@
+# tests/test_migrations.py
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from database import db
+from database.migrations import SCHEMA_VERSION, schema_version
+
+BASELINE_DB = Path(__file__).resolve().parent.parent / "database" / "bot.db"
+
+@pytest.fixture
+def baseline(tmp_path, monkeypatch):
+    """A copy of the shipped pre-migration database, opened through database.db."""
+    path = tmp_path / "bot.db"
+    shutil.copy(BASELINE_DB, path)
+    with sqlite3.connect(path) as conn:
+        assert schema_version(conn) == 0
+        rows = conn.execute("SELECT id, user_id, name, body, is_fav FROM recipes ORDER BY id").fetchall()
+    monkeypatch.setattr(db, "DB_PATH", path)
+    yield rows
+    db.close_connections()
+
+def test_baseline_migrates_to_current(baseline):
+    db.init_db()
+    assert schema_version(db.get_connection()) == SCHEMA_VERSION
+    # Running again is a no-op
+    db.init_db()
+    assert schema_version(db.get_connection()) == SCHEMA_VERSION
+
+def test_bodies_survive(baseline):
+    db.init_db()
+    for recipe_id, user_id, _, body, _ in baseline:
+        name, stored = db.get_recipe_by_id(user_id, recipe_id)
+        assert stored == body
+        assert name
+
+def test_untitled_recipe_gets_its_title(baseline):
+    untitled = [r for r in baseline if r[2] == ""]
+    assert untitled, "the baseline database should contain an untitled recipe"
+    db.init_db()
+    for recipe_id, user_id, *_ in untitled:
+        assert db.get_recipe_by_id(user_id, recipe_id)[0] == "Homemade Vegetable Samosas"
+
+def test_favorites_survive(baseline):
+    db.init_db()
+    for user_id in {r[1] for r in baseline}:
+        favorite_ids = {r[0] for r in baseline if r[1] == user_id and r[4]}
+        names = {db.get_recipe_by_id(user_id, i)[0] for i in favorite_ids}
+        assert set(db.list_favorites(user_id)) == names
+        items, _, _ = db.list_favorites_page(user_id)
+        assert {item[0] for item in items} == favorite_ids
+
+def test_search_finds_migrated_recipes(baseline):
+    db.init_db()
+    owner = {r[0]: r[1] for r in baseline}
+    for recipe_id, query in ((1, "bruschetta"), (3, "samosas"), (4, "frittata")):
+        results = db.search_recipes(owner[recipe_id], query)
+        assert recipe_id in [r[0] for r in results]
+    # Words only in the body are indexed too
+    assert 6 in [r[0] for r in db.search_recipes(owner[6], "paneer turmeric")]
@@ -0,0 +1,101 @@
+# tests/test_recipe_parser.py
+from utils.recipe_parser import clean_recipe_name, parse_recipe, recipe_title
+
+MARKDOWN_HEADINGS = """## Title
+Pad Krapow Gai
+
+## Total time
+Prep: 10 minutes
+Cook: 15 minutes
+
+## Ingredients
+- 300 g chicken thigh
+- 1 cup holy basil
+- 4 cloves garlic
+
+## Instructions
+1. Stir-fry everything.
+
+## Nutrition
+- Calories: 520 kcal
+- Protein: 32 g
+- Carbs: 45-55 g
+- Fat: 18 g
+
+## Budget
+- Chicken: 60 THB
+- Basil: 15 THB
+"""
+
+NUMBERED_BOLD_HEADINGS = """1. **Title:** Green Curry
+
+2. **Total time:** 1 hour 10 minutes
+
+3. **Ingredients**
+   - 400 ml coconut milk
+   - **Ingredients to buy:**
+   - 2 tbsp green curry paste
+
+4. **Steps**
+   1. Simmer.
+
+5. **Estimated nutrition (per serving)**
+   ~650 calories, 25g protein, 40g carbs, 45g fat
+
+6. **Estimated budget**
+   - Coconut milk ฿35
+   - Total: ~฿120
+"""
+
+BARE_TITLE_LABEL = """1. Title:
+**Homemade Vegetable Samosas**
+
+**Ingredients:**
+- 2 potatoes
+- 1 cup peas
+"""
+
+def test_clean_recipe_name():
+    assert clean_recipe_name("1. **Title:** Pad Thai") == "Pad Thai"
+    assert clean_recipe_name("**Mediterranean Veggie Pasta Skillet**") == "Mediterranean Veggie Pasta Skillet"
+    assert clean_recipe_name("1. Title: ") == ""
+
+def test_title_variants():
+    assert recipe_title(MARKDOWN_HEADINGS) == "Pad Krapow Gai"
+    assert recipe_title(NUMBERED_BOLD_HEADINGS) == "Green Curry"
+    assert recipe_title("1. Title: Italian Breakfast Bruschetta \n\n2. Total Time: 15 minutes") \
+        == "Italian Breakfast Bruschetta"
+
+def test_bare_title_label_takes_next_line():
+    assert recipe_title(BARE_TITLE_LABEL) == "Homemade Vegetable Samosas"
+
+def test_title_falls_back_to_first_line():
+    assert recipe_title("Tom Yum Soup\n\nA hot and sour soup.") == "Tom Yum Soup"
+    assert recipe_title("") == ""
+    assert recipe_title("1. Title:\n\n") == ""
+
+def test_markdown_headings():
+    details = parse_recipe(MARKDOWN_HEADINGS)
+    assert details.total_minutes == 25          # prep + cook
+    assert details.ingredients == ["300 g chicken thigh", "1 cup holy basil", "4 cloves garlic"]
+    assert details.kcal == 520
+    assert details.protein_g == 32
+    assert details.carbs_g == 50                # midpoint of the range
+    assert details.fat_g == 18
+    assert details.budget_thb == 75             # sum of the items
+
+def test_numbered_bold_headings():
+    details = parse_recipe(NUMBERED_BOLD_HEADINGS)
+    assert details.total_minutes == 70
+    # The sub-label is skipped and the steps aren't ingredients
+    assert details.ingredients == ["400 ml coconut milk", "2 tbsp green curry paste"]
+    assert details.kcal == 650
+    assert (details.protein_g, details.carbs_g, details.fat_g) == (25, 40, 45)
+    assert details.budget_thb == 120            # the stated total wins
+
+def test_bold_colon_heading():
+    details = parse_recipe(BARE_TITLE_LABEL)
+    assert details.ingredients == ["2 potatoes", "1 cup peas"]
+    assert details.total_minutes is None
+    assert details.kcal is None
+    assert details.budget_thb is None
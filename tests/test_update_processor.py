@@ -0,0 +1,73 @@
+# tests/test_update_processor.py
+import asyncio
+import time
+
+from telegram import Update
+
+from utils.update_processor import PerChatUpdateProcessor
+
+def _update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": 0, "text": "x",
+                    "chat": {"id": chat_id, "type": "private"}},
+    }, None)
+
+def _run(coro):
+    return asyncio.run(coro)
+
+def test_one_chat_runs_in_order():
+    async def main():
+        processor = PerChatUpdateProcessor(8, backlog_limit=10)
+        log = []
+
+        async def handle(n):
+            log.append(("start", n))
+            await asyncio.sleep(0.01)
+            log.append(("end", n))
+
+        for n in range(4):
+            await processor.process_update(_update(n, 1), handle(n))
+        await processor.shutdown()
+        return log
+
+    log = _run(main())
+    assert log == [(kind, n) for n in range(4) for kind in ("start", "end")]
+
+def test_busy_chat_does_not_block_other_chats():
+    async def main():
+        processor = PerChatUpdateProcessor(4, backlog_limit=10)
+        # One chat keeps typing while its first update runs for a while
+        for n in range(5):
+            await processor.process_update(_update(n, 1), asyncio.sleep(0.5 if n == 0 else 0.05))
+
+        started = time.perf_counter()
+        done = asyncio.Event()
+
+        async def quick():
+            done.set()
+
+        await processor.process_update(_update(99, 2), quick())
+        await asyncio.wait_for(done.wait(), timeout=1)
+        waited = time.perf_counter() - started
+        await processor.shutdown()
+        return waited
+
+    assert _run(main()) < 0.1
+
+def test_backlog_is_capped():
+    async def main():
+        processor = PerChatUpdateProcessor(4, backlog_limit=2)
+        ran = []
+
+        async def handle(n):
+            await asyncio.sleep(0.01)
+            ran.append(n)
+
+        for n in range(6):
+            await processor.process_update(_update(n, 1), handle(n))
+        await processor.shutdown()
+        return ran
+
+    # The running update plus two waiting; the rest are dropped
+    assert _run(main()) == [0, 1, 2]
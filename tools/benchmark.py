@@ -0,0 +1,193 @@
+# tools/benchmark.py
+"""Offline load and latency benchmark for the whole update path.
+
+Simulated users drive the real handlers (onboarding, a full /recipe flow,
+/favorites and /search) against a stub OpenAI server and a fake Bot API,
+both in this process. Reports throughput plus p50/p95/p99 per handler and
+per stage (db.*, prompt.build, admission.wait, openai.*, telegram.*).
+
+    python -m tools.benchmark --users 50 --rounds 2 --openai-latency 0.5 --tokens-per-sec 80
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+# Everything talks to local stubs in a throwaway database. These must be set
+# before config.default is imported.
+TELEGRAM_PORT = int(os.getenv("BENCH_TELEGRAM_PORT", "8091"))
+OPENAI_PORT   = int(os.getenv("BENCH_OPENAI_PORT", "8092"))
+os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{TELEGRAM_PORT}"
+os.environ["OPENAI_BASE_URL"]  = f"http://127.0.0.1:{OPENAI_PORT}/v1"
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="recipe-bench-"), "bench.db"))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Measure the bot, not the per-user rate limits
+os.environ.setdefault("USER_RECIPE_BURST", "1000000")
+os.environ.setdefault("OPENAI_TPM_BUDGET", "1000000000")
+
+from telegram import Update
+
+import bot
+from database.db import init_db
+from handlers.conversations import (
+    DIET_CHOICES, SKILL_CHOICES, BUDGET_CHOICES,
+    CUISINE_CHOICES, MEAL_CHOICES, SERVINGS_CHOICES, TIME_CHOICES,
+)
+from tools import fake_openai, fake_telegram
+from utils import stages
+from utils.log import configure_logging
+
+class StageStats:
+    """Observer collecting every duration reported through utils.stages."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = collections.defaultdict(list)
+        self.errors: collections.Counter = collections.Counter()
+
+    def __call__(self, name: str, seconds: float, ok: bool):
+        self.samples[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def rows(self, elapsed: float) -> list[dict]:
+        rows = []
+        for name, values in sorted(self.samples.items()):
+            values = sorted(values)
+            rows.append({
+                "stage":  name,
+                "count":  len(values),
+                "per_s":  len(values) / elapsed,
+                "mean":   sum(values) / len(values) * 1000,
+                "p50":    _percentile(values, 0.50) * 1000,
+                "p95":    _percentile(values, 0.95) * 1000,
+                "p99":    _percentile(values, 0.99) * 1000,
+                "max":    values[-1] * 1000,
+                "errors": self.errors[name],
+            })
+        return rows
+
+def _percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))]
+
+class SimulatedUser:
+    _update_ids = itertools.count(1)
+
+    def __init__(self, application, user_id: int, rng: random.Random, stats: StageStats):
+        self.application = application
+        self.user_id = user_id
+        self.rng = rng
+        self.stats = stats
+
+    def _update(self, text: str) -> Update:
+        update_id = next(self._update_ids)
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": {"id": self.user_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.de_json({"update_id": update_id, "message": message}, self.application.bot)
+
+    async def send(self, text: str):
+        started = time.perf_counter()
+        try:
+            await self.application.process_update(self._update(text))
+            ok = True
+        except Exception:
+            ok = False
+        self.stats("update", time.perf_counter() - started, ok)
+
+    async def run(self, rounds: int, shared_ratio: float):
+        pick = self.rng.choice
+        for r in range(rounds):
+            ingredients = (
+                "tofu, basil, garlic" if self.rng.random() < shared_ratio
+                else f"tofu, basil, item{self.user_id}x{r}"
+            )
+            for text in [
+                "/start",
+                "/onboard", pick(DIET_CHOICES), pick(SKILL_CHOICES), pick(BUDGET_CHOICES),
+                "/recipe", pick(CUISINE_CHOICES), pick(MEAL_CHOICES),
+                pick(SERVINGS_CHOICES), pick(TIME_CHOICES), ingredients,
+                "/favorites",
+                "/search stir fry",
+            ]:
+                await self.send(text)
+
+async def run(args) -> dict:
+    configure_logging()
+    telegram_api = await fake_telegram.serve(TELEGRAM_PORT, args.telegram_latency)
+    openai_api = await fake_openai.serve(
+        OPENAI_PORT, latency=args.openai_latency,
+        tokens_per_sec=args.tokens_per_sec, tokens=args.tokens,
+    )
+    init_db()
+    application = bot.build_application("123456:benchmark", updater=False)
+    stats = StageStats()
+    stages.add_observer(stats)
+    await application.initialize()
+
+    rng = random.Random(args.seed)
+    users = [
+        SimulatedUser(application, 10_000 + i, random.Random(rng.random()), stats)
+        for i in range(args.users)
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(*(u.run(args.rounds, args.shared_ratio) for u in users))
+    elapsed = time.perf_counter() - started
+
+    stages.remove_observer(stats)
+    await application.shutdown()
+    await application.post_shutdown(application)
+    return {
+        "elapsed_s": elapsed,
+        "updates": len(stats.samples["update"]),
+        "updates_per_s": len(stats.samples["update"]) / elapsed,
+        "openai_requests": openai_api.requests,
+        "telegram_calls": len(telegram_api.calls),
+        "stages": stats.rows(elapsed),
+    }
+
+def print_report(result: dict):
+    print(f"{result['updates']} updates in {result['elapsed_s']:.2f}s "
+          f"= {result['updates_per_s']:.1f} updates/s "
+          f"({result['openai_requests']} completions, {result['telegram_calls']} Bot API calls)\n")
+    header = f"{'stage':<34}{'count':>7}{'/s':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'err':>5}"
+    print(header + "\n" + "-" * len(header))
+    for row in result["stages"]:
+        print(f"{row['stage']:<34}{row['count']:>7}{row['per_s']:>8.1f}{row['mean']:>9.1f}"
+              f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{row['max']:>9.1f}{row['errors']:>5}")
+    print("\n(times in ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--rounds", type=int, default=1, help="scripted sessions per user")
+    parser.add_argument("--shared-ratio", type=float, default=0.0,
+                        help="fraction of recipe requests with identical inputs (cache hits)")
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="seconds to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=100)
+    parser.add_argument("--tokens", type=int, default=300, help="completion length")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="seconds per Bot API call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# tools/fake_openai.py
+"""A stub OpenAI chat-completions server with configurable speed.
+
+Replies with a recipe in the format the bot asks for, after `latency`
+seconds, then streams it at `tokens_per_sec` (one word per token).
+
+    python -m tools.fake_openai --port 8082 --latency 0.8 --tokens-per-sec 60
+    OPENAI_BASE_URL=http://127.0.0.1:8082/v1 python bot.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+import tornado.web
+
+logger = logging.getLogger(__name__)
+
+def fake_recipe(prompt: str, words: int) -> str:
+    """A parseable recipe whose title depends on the prompt."""
+    tag = hashlib.sha1(prompt.encode()).hexdigest()[:6]
+    head = (
+        f"1. **Title:** Benchmark Stir-Fry {tag}\n\n"
+        "2. **Total time (prep + cook):** 25 minutes\n\n"
+        "3. **Ingredients**\n   - 200 g tofu (35 THB)\n   - 1 bunch basil (10 THB)\n\n"
+        "4. **Step-by-step instructions**\n"
+    )
+    tail = (
+        "\n\n6. **Estimated nutrition per serving**\n   - Calories: 420 kcal\n"
+        "   - Protein: 22 g\n   - Carbohydrates: 45 g\n   - Fat: 16 g\n\n"
+        "7. **Budget breakdown (approx. THB)**\n   - **Total: ~45 THB**\n"
+    )
+    filler = max(0, words - len((head + tail).split()))
+    steps = " ".join(f"stir{i % 7}" for i in range(filler))
+    return head + "   1. " + steps + tail
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.5, tokens_per_sec: float = 50, tokens: int = 300):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.tokens = tokens
+        self.requests = 0
+
+class _CompletionsHandler(tornado.web.RequestHandler):
+    def initialize(self, api: FakeOpenAI):
+        self.api = api
+
+    async def post(self):
+        self.api.requests += 1
+        body = json.loads(self.request.body)
+        prompt = body["messages"][-1]["content"]
+        words = fake_recipe(prompt, self.api.tokens).split(" ")
+        usage = {
+            "prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 4,
+            "completion_tokens": len(words),
+            "total_tokens": 0,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "fake")}
+
+        await asyncio.sleep(self.api.latency)
+        if not body.get("stream"):
+            await asyncio.sleep(len(words) / self.api.tokens_per_sec)
+            self.write({**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": " ".join(words)},
+            }]})
+            return
+
+        self.set_header("Content-Type", "text/event-stream")
+        interval = 1 / self.api.tokens_per_sec
+        for i, word in enumerate(words):
+            piece = word if i == 0 else " " + word
+            self._event({**base, "object": "chat.completion.chunk", "choices": [{
+                "index": 0, "delta": {"content": piece}, "finish_reason": None,
+            }]})
+            await self.flush()
+            await asyncio.sleep(interval)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._event({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        self.write("data: [DONE]\n\n")
+
+    def _event(self, data: dict):
+        self.write(f"data: {json.dumps(data)}\n\n")
+
+def make_app(api: FakeOpenAI) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/v1/chat/completions", _CompletionsHandler, {"api": api}),
+    ])
+
+async def serve(port: int, **kwargs) -> FakeOpenAI:
+    """Start the stub on 127.0.0.1:port in the running loop."""
+    api = FakeOpenAI(**kwargs)
+    make_app(api).listen(port, address="127.0.0.1")
+    return api
+
+async def _main(args):
+    await serve(args.port, latency=args.latency, tokens_per_sec=args.tokens_per_sec, tokens=args.tokens)
+    logger.info("Fake OpenAI on http://127.0.0.1:%d/v1", args.port)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50)
+    parser.add_argument("--tokens", type=int, default=300, help="completion length")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
@@ -0,0 +1,103 @@
+# tools/fake_telegram.py
+"""A minimal stand-in for the Telegram Bot API, for running the bot offline.
+
+Answers the methods the bot calls (getMe, setWebhook, sendMessage,
+editMessageText, ...) with plausible results and remembers every call.
+
+    python -m tools.fake_telegram --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python bot.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+import tornado.web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "RecipeBot", "username": "recipe_test_bot"}
+
+class FakeTelegram:
+    """Bot API state: recorded calls and message ids per chat."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: list[tuple[str, dict]] = []
+        self._message_ids = itertools.count(1000)
+
+    def _message(self, params: dict) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        message_id = int(params["message_id"]) if "message_id" in params else next(self._message_ids)
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        # Telegram only echoes inline keyboards back on the message
+        markup = json.loads(params.get("reply_markup") or "{}")
+        if "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        return message
+
+    def handle(self, method: str, params: dict):
+        """Return the result for a Bot API call."""
+        self.calls.append((method, params))
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params)
+        if method == "getUpdates":
+            return []
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        # setWebhook, deleteWebhook, answerCallbackQuery, sendChatAction, ...
+        return True
+
+class _MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api: FakeTelegram):
+        self.api = api
+
+    async def post(self, token: str, method: str):
+        # python-telegram-bot sends form fields with non-string values JSON-encoded
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(self.request.body or b"{}")
+        else:
+            params = {k: self.get_body_argument(k) for k in self.request.body_arguments}
+        if self.api.latency:
+            await asyncio.sleep(self.api.latency)
+        if method == "getUpdates":
+            # Long poll that never receives anything
+            await asyncio.sleep(float(params.get("timeout") or 0))
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({"ok": True, "result": self.api.handle(method, params)}))
+
+    get = post
+
+def make_app(api: FakeTelegram) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/bot([^/]+)/(\w+)", _MethodHandler, {"api": api}),
+    ])
+
+async def serve(port: int, latency: float = 0.0) -> FakeTelegram:
+    """Start the fake API on 127.0.0.1:port in the running loop."""
+    api = FakeTelegram(latency)
+    make_app(api).listen(port, address="127.0.0.1")
+    return api
+
+async def _main(port: int, latency: float):
+    await serve(port, latency)
+    logger.info("Fake Bot API on http://127.0.0.1:%d", port)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.port, args.latency))
@@ -0,0 +1,86 @@
+# tools/replay_updates.py
+"""POST recorded Update JSON (one object per line) to a webhook.
+
+    BOT_MODE=webhook WEBHOOK_SECRET=s3cret TELEGRAM_API_URL=http://127.0.0.1:8081 python bot.py
+    python -m tools.replay_updates tools/sample_updates.jsonl --secret s3cret
+
+Prints the HTTP status counts and request latency.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import statistics
+import sys
+import time
+
+import httpx
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def load_updates(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+async def replay(
+    updates: list[dict],
+    url: str,
+    secret: str | None,
+    concurrency: int = 1,
+    repeat: int = 1,
+) -> tuple[collections.Counter, list[float]]:
+    """Send every update repeat times; returns (status counts, latencies in s).
+
+    Repeats get fresh update_ids so the bot doesn't see duplicates.
+    """
+    headers = {SECRET_HEADER: secret} if secret else {}
+    statuses: collections.Counter = collections.Counter()
+    latencies: list[float] = []
+    slots = asyncio.Semaphore(concurrency)
+    top_id = max((u.get("update_id", 0) for u in updates), default=0)
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def send(update: dict):
+            async with slots:
+                started = time.perf_counter()
+                try:
+                    resp = await client.post(url, json=update, headers=headers)
+                    statuses[resp.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        batch = [
+            dict(u, update_id=u.get("update_id", 0) + r * (top_id + 1))
+            for r in range(repeat) for u in updates
+        ]
+        await asyncio.gather(*(send(u) for u in batch))
+    return statuses, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="JSONL file of Update objects")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    updates = load_updates(args.path)
+    started = time.perf_counter()
+    statuses, latencies = asyncio.run(
+        replay(updates, args.url, args.secret, args.concurrency, args.repeat)
+    )
+    elapsed = time.perf_counter() - started
+
+    print(f"Sent {len(latencies)} updates in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s)")
+    print("Status:", dict(statuses))
+    if latencies:
+        latencies.sort()
+        print(f"Latency ms: median {statistics.median(latencies) * 1000:.1f}, "
+              f"max {latencies[-1] * 1000:.1f}")
+    if set(statuses) - {200}:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# tools/startup_benchmark.py
+"""Cold-start benchmark: how long until a fresh process can take updates.
+
+Each run starts a new interpreter that imports bot, runs init_db, builds the
+Application and initializes it against the fake Bot API (tools/fake_telegram.py),
+timing each phase. The first run creates the schema; the rest find it current.
+
+    python -m tools.startup_benchmark --runs 10 --budget 1.0
+
+Exits non-zero when the median time to ready exceeds --budget seconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASES = ("import", "init_db", "build", "initialize")
+
+# Runs in the child; prints phase timings as JSON
+_CHILD = """
+import asyncio, json, time
+t0 = time.perf_counter()
+import bot
+t1 = time.perf_counter()
+bot.init_db()
+t2 = time.perf_counter()
+application = bot.build_application("123456:startup")
+t3 = time.perf_counter()
+async def initialize():
+    await application.initialize()
+    await application.shutdown()
+asyncio.run(initialize())
+t4 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "init_db": t2 - t1, "build": t3 - t2, "initialize": t4 - t3}))
+"""
+
+def _run_once(env: dict) -> dict:
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD], env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    timings = json.loads(out.strip().splitlines()[-1])
+    # Includes interpreter start-up, which the phases don't see
+    timings["process"] = time.perf_counter() - started
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8093, help="port for the fake Bot API")
+    parser.add_argument("--budget", type=float, default=1.0, help="max median seconds to ready")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {
+        **os.environ,
+        "PYTHONPATH": root,
+        "DB_FILE": os.path.join(tempfile.mkdtemp(prefix="recipe-startup-"), "startup.db"),
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{args.port}",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "startup"),
+        "METRICS_ENABLED": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "tools.fake_telegram", "--port", str(args.port)],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(1)
+        fresh = _run_once(env)
+        runs = [_run_once(env) for _ in range(args.runs)]
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    print(f"{'phase':<12}{'fresh db':>10}{'median':>10}{'max':>10}   (ms, {args.runs} runs on a current schema)")
+    for phase in (*PHASES, "process"):
+        values = [r[phase] for r in runs]
+        print(f"{phase:<12}{fresh[phase] * 1000:>10.1f}{statistics.median(values) * 1000:>10.1f}"
+              f"{max(values) * 1000:>10.1f}")
+
+    ready = statistics.median(r["process"] for r in runs)
+    verdict = "OK" if ready <= args.budget else "TOO SLOW"
+    print(f"\nmedian time to ready: {ready:.3f}s (budget {args.budget:.3f}s) {verdict}")
+    sys.exit(0 if ready <= args.budget else 1)
+
+if __name__ == "__main__":
+    main()
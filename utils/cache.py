@@ -0,0 +1,53 @@
+# utils/cache.py
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+class LRUCache:
+    """Small thread-safe LRU map with hit/miss counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits    = 0
+        self.misses  = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock   = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size":     len(self._data),
+            "maxsize":  self.maxsize,
+            "hits":     self.hits,
+            "misses":   self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
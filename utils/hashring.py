@@ -0,0 +1,26 @@
+# utils/hashring.py
+import bisect
+import hashlib
+
+class HashRing:
+    """Consistent hashing of integer keys onto nodes 0..n-1.
+
+    Each node owns `replicas` points on the ring, so keys spread evenly and
+    changing the node count only moves about 1/n of them.
+    """
+
+    def __init__(self, nodes: int, replicas: int = 64):
+        points = sorted(
+            (self._hash(f"node-{node}-{r}"), node)
+            for node in range(nodes) for r in range(replicas)
+        )
+        self._hashes = [h for h, _ in points]
+        self._nodes  = [n for _, n in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key: int) -> int:
+        i = bisect.bisect(self._hashes, self._hash(str(key))) % len(self._hashes)
+        return self._nodes[i]
@@ -1,5 +1,10 @@
 # utils/helpers.py
-from telegram import ReplyKeyboardMarkup
+import asyncio
+import time
+from typing import AsyncIterator
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message, ReplyKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
 
 from models.user_preferences import UserPreferences
 
@@ -14,3 +19,120 @@ def build_reply_keyboard(options: list) -> ReplyKeyboardMarkup:
     # one-button-per-row keyboard
     keyboard = [[opt] for opt in options]
     return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+
+
+def build_recipe_list_keyboard(
+    items: list[tuple[int, str]],
+    prev_cursor: int | None = None,
+    next_cursor: int | None = None,
+) -> InlineKeyboardMarkup:
+    """One tappable button per (recipe_id, name), plus prev/next paging."""
+    # Telegram rejects buttons without text; older rows can have an empty name
+    keyboard = [
+        [InlineKeyboardButton((name if len(name) <= 60 else name[:59] + "…") or f"Recipe #{recipe_id}",
+                              callback_data=f"open|{recipe_id}")]
+        for recipe_id, name in items
+    ]
+    nav = []
+    if prev_cursor is not None:
+        nav.append(InlineKeyboardButton("◀️ Prev", callback_data=f"favp|prev|{prev_cursor}"))
+    if next_cursor is not None:
+        nav.append(InlineKeyboardButton("Next ▶️", callback_data=f"favp|next|{next_cursor}"))
+    if nav:
+        keyboard.append(nav)
+    return InlineKeyboardMarkup(keyboard)
+
+# Telegram rejects messages longer than this
+MESSAGE_LIMIT = 4096
+# Flood-control waits sat out for the final edit and follow-ups before giving up
+FLOOD_RETRIES = 5
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """Split text into chunks under limit, preferring line breaks."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        chunks.append(text)
+    return chunks
+
+async def stream_to_message(
+    message: Message,
+    pieces: AsyncIterator[str],
+    placeholder: str,
+    interval: float,
+) -> str:
+    """Reply with placeholder, then edit it as pieces arrive.
+
+    Edits are coalesced to at most one per interval so we stay inside
+    Telegram's per-chat edit limits. The final edit always carries the
+    full text, sitting out flood-control waits (up to FLOOD_RETRIES);
+    anything past the message limit is sent as follow-ups.
+
+    Returns:
+        The complete text that was streamed; "" (with an error shown in
+        the placeholder) if nothing was.
+    """
+    sent = await message.reply_text(placeholder)
+    text = ""
+    shown = placeholder
+    next_edit = time.monotonic() + interval
+
+    async def edit(new_text: str, wait: bool = False):
+        # Intermediate edits skip flood control; the final one waits it out
+        nonlocal shown, next_edit
+        for attempt in range(FLOOD_RETRIES + 1):
+            try:
+                await sent.edit_text(new_text, disable_web_page_preview=True)
+                shown = new_text
+                return
+            except RetryAfter as e:
+                if not wait:
+                    next_edit = time.monotonic() + float(e.retry_after)
+                    return
+                if attempt == FLOOD_RETRIES:
+                    raise
+                await asyncio.sleep(float(e.retry_after))
+            except BadRequest as e:
+                if "not modified" not in str(e).lower():
+                    raise
+                return
+
+    async def reply(chunk: str):
+        for attempt in range(FLOOD_RETRIES + 1):
+            try:
+                return await message.reply_text(chunk, disable_web_page_preview=True)
+            except RetryAfter as e:
+                if attempt == FLOOD_RETRIES:
+                    raise
+                await asyncio.sleep(float(e.retry_after))
+
+    try:
+        async for piece in pieces:
+            text += piece
+            if time.monotonic() >= next_edit:
+                preview = text if len(text) <= MESSAGE_LIMIT else text[:MESSAGE_LIMIT - 1] + "…"
+                if preview.strip() and preview != shown:
+                    next_edit = time.monotonic() + interval
+                    await edit(preview)
+    except Exception as e:
+        # Exceptions may carry a chat-safe explanation (e.g. admission control)
+        await edit(getattr(e, "user_message", None)
+                   or "❌ Something went wrong while generating your recipe. Please try /recipe again.")
+        raise
+
+    if not text.strip():
+        # Nothing to show; callers treat "" as a failed generation
+        await edit("❌ The kitchen came back empty-handed. Please try /recipe again.", wait=True)
+        return ""
+
+    chunks = split_message(text)
+    if chunks[0] != shown:
+        await edit(chunks[0], wait=True)
+    for chunk in chunks[1:]:
+        await reply(chunk)
+    return text
@@ -0,0 +1,41 @@
+# utils/log.py
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from config.default import LOG_LEVEL, LOG_FORMAT
+
+_listener: QueueListener | None = None
+
+def configure_logging(level: str | int = LOG_LEVEL) -> QueueListener:
+    """Route all logging through a queue drained by a background thread.
+
+    Handlers on the event loop only enqueue records; writing to stderr
+    happens on the listener thread. Idempotent.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(log_queue)]
+    root.setLevel(level)
+    # httpx logs every getUpdates poll at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,148 @@
+# utils/recipe_parser.py
+import re
+
+from models.recipe_details import RecipeDetails
+
+_LEADING_NUMBER = re.compile(r'^\d+[\.\s]*')
+_TITLE_LABEL    = re.compile(r'^Title[:\s]*', re.IGNORECASE)
+
+def clean_recipe_name(name: str) -> str:
+    """Normalise a generated title for storage and display.
+
+    Strips list numbering ("1."), a "Title:" label and stray markdown
+    emphasis, e.g. "1. **Title:** Pad Thai" -> "Pad Thai".
+    """
+    cleaned = name.strip().strip("*# ")
+    cleaned = _LEADING_NUMBER.sub('', cleaned)   # Remove leading numbers and dots
+    cleaned = cleaned.strip("*# ")
+    cleaned = _TITLE_LABEL.sub('', cleaned)      # Remove 'Title:'
+    return cleaned.strip("*# ")                  # Remove markdown and whitespace
+
+# ─── STRUCTURED FIELDS ───────────────────────────────────────────────────────
+# Generated recipes follow the output format in SYSTEM_PROMPT, but headings
+# come back as "## Ingredients", "3. **Ingredients**", "**Ingredients:**" etc.
+# A line opens a section when it looks like a heading and starts with one of
+# these keywords once numbering and markdown are stripped.
+_SECTIONS = [
+    ("time",         re.compile(r'(total\s+)?time\b|prep\s*(\+|&|and)\s*cook', re.IGNORECASE)),
+    ("ingredients",  re.compile(r'ingredients?\b', re.IGNORECASE)),
+    ("instructions", re.compile(r'(steps?|instructions|directions|method)\b', re.IGNORECASE)),
+    ("serving",      re.compile(r'(serving|plating)\b', re.IGNORECASE)),
+    ("nutrition",    re.compile(r'(estimated\s+)?nutrition', re.IGNORECASE)),
+    ("budget",       re.compile(r'(estimated\s+)?budget|cost\b', re.IGNORECASE)),
+    ("title",        re.compile(r'title\b', re.IGNORECASE)),
+]
+_HEADING     = re.compile(r'^\s*(#{1,6}\s*|\d+[\.\)]\s*\**|\*\*)')
+_HEADING_PFX = re.compile(r'^[\s#*\d\.\)]*')
+_LIST_ITEM   = re.compile(r'^\s*([-*•]|\d+[\.\)])\s+')
+
+_NUMBER   = r'(\d+(?:[.,]\d+)?)(?:\s*(?:-|–|to)\s*(\d+(?:[.,]\d+)?))?'
+_HOURS    = re.compile(_NUMBER + r'\s*(?:hours?|hrs?|h)\b', re.IGNORECASE)
+_MINUTES  = re.compile(_NUMBER + r'\s*(?:minutes?|mins?|m)\b', re.IGNORECASE)
+_KCAL     = re.compile(r'(?:' + _NUMBER + r'\s*(?:kcal|calories|cal)\b)'
+                       r'|(?:(?:kcal|calories|energy)\W{0,5}~?\s*' + _NUMBER + r')', re.IGNORECASE)
+_THB      = re.compile(r'(?:(?:฿|THB)\s*~?\s*' + _NUMBER + r')'
+                       r'|(?:' + _NUMBER + r'\s*(?:THB|baht|฿))', re.IGNORECASE)
+
+def _macro(name: str) -> re.Pattern:
+    # "Protein: 25 g" or "25g protein"
+    return re.compile(rf'(?:{name}\W{{0,5}}~?\s*{_NUMBER}\s*g\b)|(?:{_NUMBER}\s*g\s+(?:of\s+)?{name})',
+                      re.IGNORECASE)
+
+_PROTEIN = _macro(r'protein')
+_CARBS   = _macro(r'carb(?:ohydrate)?s?')
+_FAT     = _macro(r'(?:total\s+)?fats?')
+
+def _value(match: re.Match | None) -> float | None:
+    """Number from a match of one of the patterns above; ranges give the midpoint."""
+    if not match:
+        return None
+    groups = [g for g in match.groups()]
+    # Alternations repeat the (low, high) pair, take the one that matched
+    for i in range(0, len(groups), 2):
+        if groups[i] is not None:
+            low = float(groups[i].replace(",", "."))
+            high = groups[i + 1]
+            return (low + float(high.replace(",", "."))) / 2 if high else low
+    return None
+
+def _sections(body: str) -> dict[str, list[str]]:
+    """Group body lines by the section they fall under (first occurrence wins)."""
+    sections: dict[str, list[str]] = {}
+    current = None
+    for line in body.splitlines():
+        if _HEADING.match(line):
+            text = _HEADING_PFX.sub('', line)
+            kind = next((k for k, rx in _SECTIONS if rx.match(text)), None)
+            # A repeated heading ("**Ingredients to buy:**") continues the section
+            if kind and kind != current:
+                current = kind if kind not in sections else None
+                if current:
+                    sections[current] = []
+        if current:
+            sections[current].append(line)
+    return sections
+
+def recipe_title(body: str) -> str:
+    """The recipe's title, or "" when the model left it out.
+
+    Handles "1. Title: Pad Thai" as well as a bare "1. Title:" label with the
+    name on the following line; bodies without a title heading fall back to
+    their first line.
+    """
+    lines = _sections(body).get("title") or body.strip().splitlines()[:1]
+    return next((name for name in map(clean_recipe_name, lines) if name), "")
+
+def _minutes(text: str) -> int | None:
+    hours = _value(_HOURS.search(text))
+    minutes = _value(_MINUTES.search(text))
+    if hours is None and minutes is None:
+        return None
+    return round((hours or 0) * 60 + (minutes or 0))
+
+def _total_minutes(lines: list[str]) -> int | None:
+    # "Total time: 35 minutes" on the heading or a "Total" line wins;
+    # otherwise add up the prep/cook lines.
+    for line in lines:
+        if re.search(r'total', line, re.IGNORECASE) and (m := _minutes(line)) is not None:
+            return m
+    if lines and (m := _minutes(lines[0])) is not None:
+        return m
+    parts = [m for line in lines[1:] if (m := _minutes(line)) is not None]
+    return sum(parts) if parts else None
+
+def _budget(lines: list[str]) -> float | None:
+    # Prefer the stated total; otherwise add up the per-item prices
+    for line in reversed(lines):
+        if re.search(r'total', line, re.IGNORECASE) and (v := _value(_THB.search(line))) is not None:
+            return v
+    prices = [v for line in lines[1:] if (v := _value(_THB.search(line))) is not None]
+    return sum(prices) if prices else None
+
+def _ingredients(lines: list[str]) -> list[str]:
+    items = []
+    for line in lines[1:]:
+        if _LIST_ITEM.match(line):
+            item = _LIST_ITEM.sub('', line).replace("**", "").strip()
+            # "Ingredients to buy:" style sub-labels aren't ingredients
+            if item and not item.endswith(":"):
+                items.append(item)
+    return items
+
+def parse_recipe(body: str) -> RecipeDetails:
+    """Extract time, ingredients, nutrition and budget from a generated recipe.
+
+    Fields that can't be found are left as None; nutrition is per serving
+    as the prompt asks for it.
+    """
+    sections = _sections(body)
+    nutrition = "\n".join(sections.get("nutrition", []))
+    return RecipeDetails(
+        total_minutes=_total_minutes(sections.get("time", [])),
+        kcal=_value(_KCAL.search(nutrition)),
+        protein_g=_value(_PROTEIN.search(nutrition)),
+        carbs_g=_value(_CARBS.search(nutrition)),
+        fat_g=_value(_FAT.search(nutrition)),
+        budget_thb=_budget(sections.get("budget", [])),
+        ingredients=_ingredients(sections.get("ingredients", [])),
+    )
@@ -0,0 +1,78 @@
+# utils/stages.py
+"""Timing hooks for the request path.
+
+Code marks the interesting parts of an update with stage() ("db.save_recipe",
+"openai.generate", "telegram.sendMessage", ...) and handlers are wrapped by
+instrument_handlers(). Nothing is recorded until an observer is registered,
+so the hooks cost two perf_counter() calls when unused. The benchmark,
+metrics and tracing all subscribe here.
+"""
+import functools
+import time
+from typing import Callable
+
+from telegram.ext import BaseHandler, ConversationHandler
+from telegram.request import HTTPXRequest
+
+# observer(name, seconds, ok)
+Observer = Callable[[str, float, bool], None]
+
+_observers: list[Observer] = []
+
+# "handler.<callback>" -> (conversation name, state) for conversation states
+handler_states: dict[str, tuple[str, object]] = {}
+
+def add_observer(fn: Observer):
+    _observers.append(fn)
+
+def remove_observer(fn: Observer):
+    _observers.remove(fn)
+
+def observe(name: str, seconds: float, ok: bool = True):
+    """Report a duration measured elsewhere (e.g. time to first token)."""
+    for fn in _observers:
+        fn(name, seconds, ok)
+
+class stage:
+    """Context manager timing a block as `name`; works in sync and async code."""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if _observers:
+            observe(self.name, time.perf_counter() - self.started, exc_type is None)
+        return False
+
+def _timed_callback(callback, name: str):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with stage(name):
+            return await callback(update, context)
+    return wrapper
+
+def instrument_handlers(handlers: list[BaseHandler]):
+    """Time every handler callback as "handler.<callback name>", in place."""
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            for state, state_handlers in handler.states.items():
+                for h in state_handlers:
+                    handler_states[f"handler.{h.callback.__name__}"] = (handler.name, state)
+            nested = [*handler.entry_points, *handler.fallbacks]
+            nested += [h for hs in handler.states.values() for h in hs]
+            instrument_handlers(nested)
+        elif not getattr(handler.callback, "__wrapped__", None):
+            handler.callback = _timed_callback(handler.callback, f"handler.{handler.callback.__name__}")
+
+class StagedRequest(HTTPXRequest):
+    """HTTPXRequest that times each Bot API call as "telegram.<method>"."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with stage(f"telegram.{url.rsplit('/', 1)[-1]}"):
+            return await super().do_request(url, method, *args, **kwargs)
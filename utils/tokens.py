@@ -0,0 +1,50 @@
+# utils/tokens.py
+import functools
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Every chat message costs a few tokens of framing on top of its content
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY   = 3
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use; offline hosts can't fetch them
+        logger.warning("tiktoken unavailable for %s, estimating tokens: %s", model, e)
+        return None
+
+def load_encoding(model: str) -> bool:
+    """Load the tokenizer for model; the first call may download it, so run it off the event loop."""
+    return _encoding(model) is not None
+
+def count_tokens(text: str, model: str) -> int:
+    """Tokens in text for model, exact with tiktoken, else ~4 chars per token."""
+    enc = _encoding(model)
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text))
+
+# The system prompt is the same on every request; encode it once
+_count_system = functools.lru_cache(maxsize=32)(count_tokens)
+
+def count_message_tokens(messages: list[dict], model: str) -> int:
+    """Prompt tokens for a chat completion request (system messages are counted once and cached)."""
+    return TOKENS_PER_REPLY + sum(
+        TOKENS_PER_MESSAGE
+        + (_count_system if m["role"] == "system" else count_tokens)(m["content"], model)
+        for m in messages
+    )
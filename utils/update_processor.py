@@ -0,0 +1,98 @@
+# utils/update_processor.py
+"""Concurrent updates across chats, strictly ordered within one chat.
+
+The /recipe and /onboard flows are ConversationHandlers, which are not safe
+when two updates from the same chat run at once: a quick double tap could
+pass through the same state twice and overwrite user_data. Each chat gets a
+FIFO drained by a single consumer task, so its updates run one after another.
+
+Only running updates count against CONCURRENT_UPDATES. Updates queued behind
+their chat's running one hold no slot, so a chat that keeps typing during a
+long generation can't starve the others; its backlog is capped instead.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# PTB holds its own slot only while an update is handed to its chat's queue
+_HANDOFF_SLOTS = 1 << 30
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates of the same chat (or user, without a chat) one at a time."""
+
+    __slots__ = ("_limit", "_slots", "_backlog_limit", "_queues", "_consumers")
+
+    def __init__(self, max_concurrent_updates: int, backlog_limit: int):
+        self._limit = max_concurrent_updates   # read by the base class
+        super().__init__(_HANDOFF_SLOTS)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._backlog_limit = backlog_limit
+        # Only chats with an update queued or running have an entry
+        self._queues: dict[int | None, deque[Awaitable[Any]]] = {}
+        self._consumers: set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque([coroutine])
+            task = asyncio.create_task(self._drain(key, queue), name=f"chat-{key}")
+            self._consumers.add(task)
+            task.add_done_callback(self._consumers.discard)
+        elif len(queue) > self._backlog_limit:
+            # The first entry is the running update
+            logger.warning("Chat %s has %d updates waiting; dropping update", key, len(queue) - 1)
+            if hasattr(coroutine, "close"):
+                coroutine.close()
+        else:
+            queue.append(coroutine)
+
+    async def _drain(self, key: int, queue: deque):
+        try:
+            while queue:
+                try:
+                    async with self._slots:
+                        await queue[0]
+                except Exception:
+                    # Application.process_update already ran the error handlers
+                    logger.exception("Update for chat %s failed", key)
+                queue.popleft()
+        finally:
+            del self._queues[key]
+            # Cancelled at shutdown: nothing will await the rest
+            for coroutine in queue:
+                if hasattr(coroutine, "close"):
+                    coroutine.close()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        """Let updates already handed over finish."""
+        if self._consumers:
+            await asyncio.gather(*self._consumers, return_exceptions=True)